@@ -3,6 +3,7 @@
 #include<string.h>
 #include<time.h>
 #include "sudoku-pub.h"
+#include "sudoku-bits.h"
 #include "html-gen.h"
 
 #define SYSTEM_PAUSE
@@ -11,11 +12,14 @@
 #define MAX_NUM 10000
 #define MAX_TRIALS 10
 int my_random (int num);
+unsigned MixSeed (unsigned long seed,unsigned long index);
 typedef struct s_params
 {
 	int blockWidth,blockHeight,nGrids,*offsetsX,* offsetsY;
 	char samurai,diagonals;
 	int num,restrictinters;
+	unsigned long seed;
+	int shard,numShards;
 }
 t_params;
 int ParseParams(t_params *p,int argc,char *argv[]);
@@ -29,7 +33,6 @@ int main(int argc,char *argv[])
 	int *cells,*symbols;
 	char *given;
 	FILE *pf;
-	srand((unsigned)time(NULL));
 	PrintGPL(stdout);
 	if(ParseParams(&par,argc,argv)!=0)
 	{
@@ -37,7 +40,7 @@ int main(int argc,char *argv[])
 		return -1;
 	}
 	printf("Run \"demo4-creator -h\" for help.\n");
-	printf("Creating %d problems...\n",par.num);
+	printf("Creating %d problems (seed %lu, shard %d of %d)...\n",par.num,par.seed,par.shard,par.numShards);
 	if(par.samurai)
 		b=ConstructSamuraiBoard(par.blockWidth,par.blockHeight,par.diagonals);
 	else
@@ -81,14 +84,15 @@ int main(int argc,char *argv[])
 }
 int CreateProblems(t_board_p b,t_params *p,int *cells,int *symbols,char *given,int serial)
 {
-	int np,trials,nSy,nCl,i,j,k,n,c,s;
+	int np,trials,nCl,i,j,k,n,c,s;
+	t_mask m;
 	e_state state;
 	char name[4][50];
 	FILE *pf,*raw;
-	nSy=GetNumSymbols(b);
 	nCl=GetNumCells(b);
 	for(np=0;np<p->num;np++)
 	{
+		srand(MixSeed(p->seed,p->shard+(unsigned long)np*p->numShards));	/* Every problem depends only on the seed and its index */
 		CleanBoard(b);
 		n=trials=0;
 			do
@@ -97,15 +101,9 @@ int CreateProblems(t_board_p b,t_params *p,int *cells,int *symbols,char *given,i
 					c=my_random(nCl);
 				while(GetNumPossValuesOfCell(b,c)==1||(p->restrictinters&&GetNumGroupsOfCell(b,c)>=p->restrictinters));
 				s=my_random(GetNumPossValuesOfCell(b,c));
-				for(i=j=0;i<nSy;i++)
-					if((1<<i)&GetPossValuesOfCell(b,c))
-					{
-						if(j==s)
-							break;
-						else
-							j++;
-					}
-				s=i;
+				for(m=GetPossValuesOfCell(b,c);s>0;s--)	/* Skip s possible values */
+					m=MASK_NEXT(m);
+				s=MASK_LOWEST(m);
 				SetSymbolInCell(b,s,c);
 				Solve(b,0,FALSE);
 				state=GetState(b);
@@ -254,6 +252,9 @@ int ParseParams(t_params *p,int argc,char *argv[])
 	p->samurai=p->diagonals=FALSE;
 	p->num=1;
 	p->restrictinters=0;
+	p->seed=(unsigned long)time(NULL);
+	p->shard=0;
+	p->numShards=1;
 	ok=TRUE;
 	wrong=incompatible=nomem=FALSE;
 	for(i=1;i<argc&&ok;i++)
@@ -376,13 +377,43 @@ int ParseParams(t_params *p,int argc,char *argv[])
 				break;
 			}
 		}
+		else if(!strcmp(argv[i],"-seed"))
+		{
+			i++;
+			if(i>=argc)
+			{
+				ok=FALSE;
+				wrong=TRUE;
+				break;
+			}
+			p->seed=strtoul(argv[i],NULL,10);
+		}
+		else if(!strcmp(argv[i],"-shard"))
+		{
+			i++;
+			if(i+1>=argc)
+			{
+				ok=FALSE;
+				wrong=TRUE;
+				break;
+			}
+			p->shard=atoi(argv[i]);
+			p->numShards=atoi(argv[i+1]);
+			if(p->numShards<1||p->shard<0||p->shard>=p->numShards)
+			{
+				ok=FALSE;
+				wrong=TRUE;
+				break;
+			}
+			i++;
+		}
 		else if(!strcmp(argv[i],"-diagonals"))
 		{
 			p->diagonals=TRUE;
 		}
 		else if(!strcmp(argv[i],"-h"))
 		{
-			printf("\n\tUSAGE:\n\tdemo4-creator [parameters]\n\n\tPOSSIBLE PARAMETERS:\n\t  -h\t(show this help)\n\t  -samurai\n\t  -grids n x1 y1 x2 y2... xn yn\n\t  -blocksize width height\n\t  -diagonals\n\t  -num n\n\t  -restrictinters numinters\n\n");
+			printf("\n\tUSAGE:\n\tdemo4-creator [parameters]\n\n\tPOSSIBLE PARAMETERS:\n\t  -h\t(show this help)\n\t  -samurai\n\t  -grids n x1 y1 x2 y2... xn yn\n\t  -blocksize width height\n\t  -diagonals\n\t  -num n\n\t  -restrictinters numinters\n\t  -seed n\n\t  -shard k numshards\t(create problems k, k+numshards...)\n\n");
 			FreeParams(p);
 			return -1;
 		}
@@ -415,6 +446,14 @@ void FreeParams(t_params *p)
 		p->offsetsY=NULL;
 	}
 }
+unsigned MixSeed(unsigned long seed,unsigned long index)
+{
+	unsigned long long z;
+	z=seed+(index+1)*0x9E3779B97F4A7C15ULL;	/* splitmix64, so that near */
+	z=(z^(z>>30))*0xBF58476D1CE4E5B9ULL;	/* indexes give unrelated seeds */
+	z=(z^(z>>27))*0x94D049BB133111EBULL;
+	return (unsigned)(z^(z>>31));
+}
 int my_random(int num)
 {
 	double d;
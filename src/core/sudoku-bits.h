@@ -0,0 +1,52 @@
+/*
+    sudoku-bits.h
+
+    Bit operations on masks. GCC and Clang provide builtins that
+    compile to single instructions (popcnt, tzcnt) where the target
+    has them; other compilers get portable versions.
+*/
+
+#ifndef _SUDOKU_BITS_H_
+#define _SUDOKU_BITS_H_
+
+#include "sudoku-pub.h"
+
+/*/////////////////////////////////////////////////////////////// */
+
+#if defined(__GNUC__)
+
+#define MASK_COUNT(m)   __builtin_popcountll (m)  /* Num. of ones */
+#define MASK_LOWEST(m)  __builtin_ctzll (m)       /* Index of the */
+                                                  /* lowest one */
+#else                                             /* (m != 0) */
+
+static int MaskCount (t_mask m)
+{
+  int n;
+
+  for (n=0; m; n++)
+    m &= m - 1;    /* Clear the lowest bit */
+
+  return n;
+}
+
+static int MaskLowest (t_mask m)
+{
+  int n;
+
+  for (n=0; !(m & 1); n++)
+    m >>= 1;
+
+  return n;
+}
+
+#define MASK_COUNT(m)   MaskCount (m)
+#define MASK_LOWEST(m)  MaskLowest (m)
+
+#endif
+
+#define MASK_NEXT(m)    ((m) & ((m) - 1))   /* Clear the lowest one */
+
+/*/////////////////////////////////////////////////////////////// */
+
+#endif
@@ -0,0 +1,223 @@
+/*
+    sudoku-count.c
+
+    Counting the solutions of a board by plain backtracking. This does
+    not use the logical rules of the solver at all, so it also tells
+    apart puzzles with a unique solution that the rules can not reach.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <memory.h>
+
+#include "sudoku-pr.h"
+
+/*///////////////////////////////////////////////////////////////// */
+
+typedef struct s_counter
+{
+  t_board * b;
+  t_mask * pmUsed;  /* Mask with symbols already placed, per group */
+  char * pVal;      /* Symbol placed in every cell (-1 == none yet) */
+  t_mask * pmCand;  /* Candidates of every cell (scratch) */
+  t_mask * pmPos;   /* Cells where every symbol fits, in the */
+                    /* group being examined (scratch) */
+  int nLeft;        /* Num. of cells without a symbol */
+  int limit;        /* Stop after finding this many solutions */
+  int nSol;         /* Num. of solutions found */
+}
+t_counter;
+
+static t_mask GetCandidates (t_counter * ct, t_cell * c);
+static void PlaceSymbol (t_counter * ct, t_cell * c, int sy, int add);
+static void Search (t_counter * ct);
+
+/*///////////////////////////////////////////////////////////////// */
+
+int CountSolutions (t_board * b,   /* Puzzle to check */
+
+                    int limit)     /* Stop after finding this many */
+{                                  /* solutions (0 == count all) */
+  int i;
+  t_mask m;
+  t_counter ct;
+  t_cell * c;
+
+  if (!b || b->state==skeleton)
+    return 0;
+
+  ct.b = b;
+  ct.pmUsed = (t_mask*) malloc (b->nGr*sizeof(t_mask));
+  ct.pVal = (char*) malloc (b->nCl*sizeof(char));
+  ct.pmCand = (t_mask*) malloc (b->nCl*sizeof(t_mask));
+  ct.pmPos = (t_mask*) malloc (b->nSy*sizeof(t_mask));
+  ct.nLeft = b->nCl;
+  ct.limit = limit;
+  ct.nSol = 0;
+
+  if (!ct.pmUsed || !ct.pVal || !ct.pmCand || !ct.pmPos)
+  {
+    free (ct.pmUsed);
+    free (ct.pVal);
+    free (ct.pmCand);
+    free (ct.pmPos);
+    return -1;                   /* Not enough free memory */
+  }
+
+  memset (ct.pmUsed, 0L, b->nGr*sizeof(t_mask));
+  memset (ct.pVal, -1, b->nCl*sizeof(char));
+
+  for (i=0, c=b->pCl; i<b->nCl; i++, c++)  /* Place the symbols */
+    if (c->nPV<=1)                         /* already known */
+    {
+      if (c->nPV==0)                       /* No possible value */
+        break;
+
+      m = GetCandidates (&ct, c);
+
+      if (!(m & MASK_BIT(c->FV)))          /* Repeated in a group */
+        break;
+
+      PlaceSymbol (&ct, c, c->FV, TRUE);
+    }
+
+  if (i==b->nCl)        /* Only search if the givens are consistent */
+    Search (&ct);
+
+  free (ct.pmUsed);
+  free (ct.pVal);
+  free (ct.pmCand);
+  free (ct.pmPos);
+
+  return ct.nSol;
+}
+
+/*///////////////////////////////////////////////////////////////// */
+
+static t_mask GetCandidates (t_counter * ct, t_cell * c)
+{
+  int i;
+  t_mask m;
+
+  m = c->mPV;                 /* Possible values of the cell, */
+                              /* but not already placed in any */
+  for (i=0; i<c->nGr; i++)    /* of its groups */
+    m &= ~ ct->pmUsed[c->ppGr[i] - ct->b->pGr];
+
+  return m;
+}
+
+static void PlaceSymbol (t_counter * ct, t_cell * c, int sy, int add)
+{
+  int i;
+
+  for (i=0; i<c->nGr; i++)        /* Mark (or unmark) the symbol */
+    if (add)                      /* as used in all the groups of */
+      ct->pmUsed[c->ppGr[i] - ct->b->pGr] |= MASK_BIT(sy); /* the cell */
+    else
+      ct->pmUsed[c->ppGr[i] - ct->b->pGr] &= ~ MASK_BIT(sy);
+
+  ct->pVal[c - ct->b->pCl] = add ? sy : -1;
+  ct->nLeft += add ? -1 : 1;
+}
+
+static void Search (t_counter * ct)
+{
+  int i, j, n, min, sy;
+  t_mask m, mmin;
+  t_board * b;
+  t_cell * c, * cand;
+  t_group * g, * gcand;
+
+  b = ct->b;
+
+  if (!ct->nLeft)       /* Every cell has a symbol: */
+  {                     /* one more solution */
+    ct->nSol ++;
+    return;
+  }
+
+  cand = NULL;
+  gcand = NULL;
+  mmin = 0;
+  sy = 0;
+
+  for (i=0, min=b->nSy+1, c=b->pCl; i<b->nCl; i++, c++)
+    if (ct->pVal[i]<0)
+    {
+      m = GetCandidates (ct, c);      /* Search for the empty cell */
+      n = MASK_COUNT (m);             /* with less candidates */
+
+      if (!n)           /* No candidates at all: dead end */
+        return;
+
+      ct->pmCand[i] = m;
+
+      if (n<min)
+      {
+        cand = c;
+        mmin = m;
+        min = n;
+      }
+    }
+
+  for (i=0, g=b->pGr; min>1 && i<b->nGr; i++, g++)
+  {                                   /* Then search for the symbol */
+    memset (ct->pmPos, 0L,            /* that fits in less cells of */
+            b->nSy*sizeof(t_mask));   /* a group */
+
+    for (j=0; j<b->nSy; j++)
+    {
+      c = g->ppCl[j];
+
+      if (ct->pVal[c - b->pCl]<0)
+        for (m=ct->pmCand[c - b->pCl]; m; m=MASK_NEXT(m))
+          ct->pmPos[MASK_LOWEST(m)] |= MASK_BIT(j);
+    }
+
+    for (j=0; j<b->nSy; j++)
+      if (!(ct->pmUsed[i] & MASK_BIT(j)))
+      {
+        n = MASK_COUNT (ct->pmPos[j]);
+
+        if (!n)         /* The symbol fits nowhere: dead end */
+          return;
+
+        if (n<min)
+        {
+          gcand = g;
+          mmin = ct->pmPos[j];
+          sy = j;
+          min = n;
+        }
+      }
+  }
+
+  if (gcand)           /* Try every cell where the symbol fits */
+  {
+    for (j=0; mmin && (!ct->limit || ct->nSol<ct->limit); j++)
+      if (mmin & MASK_BIT(j))
+      {
+        mmin &= ~ MASK_BIT(j);
+        c = gcand->ppCl[j];
+
+        PlaceSymbol (ct, c, sy, TRUE);
+        Search (ct);
+        PlaceSymbol (ct, c, sy, FALSE);
+      }
+  }
+  else                 /* Try every candidate of the cell */
+  {
+    for (sy=0; mmin && (!ct->limit || ct->nSol<ct->limit); sy++)
+      if (mmin & MASK_BIT(sy))
+      {
+        mmin &= ~ MASK_BIT(sy);
+
+        PlaceSymbol (ct, cand, sy, TRUE);
+        Search (ct);
+        PlaceSymbol (ct, cand, sy, FALSE);
+      }
+  }
+}
+
+/*///////////////////////////////////////////////////////////////// */
@@ -8,7 +8,7 @@ t_board *ConstructBasicBoard(int order,char diag)
 	int n,row,col,cell,block,group;
 	t_board *b;
 	t_group *g;
-	if(order<2||order>5)
+	if(order<2||order*order>MAX_SYMBOLS)
 		return NULL;
 	n=order*order;
 	b=AllocateBoardSkeleton(n*n,diag?3*n+2:3*n,n,n,n,order,order);
@@ -62,7 +62,7 @@ t_board *ConstructCustomBoard(char wb,char hb,char diag,int nGrids,int *xg,int *
 	t_board *b;
 	t_group *g;
 	n=wb*hb;
-	if(wb<1||hb<1||n<4||n>30)
+	if(wb<1||hb<1||n<4||n>MAX_SYMBOLS)
 		return NULL;
 	if(nGrids<1||!xg||!yg)
 	{
@@ -34,6 +34,11 @@ void PrintGPL(FILE *pf)
 {
 	fprintf(pf,"-------------------------------------------------------------------\nSUDOKU SENSEI 1.03: a Sudoku Explainer Engine\nCopyright (C) 2005  Martin Knoblauch\n\nThis program is free software; you can redistribute it and/or\nmodify it under the terms of the GNU General Public License\nas published by the Free Software Foundation; either version 2\nof the License, or (at your option) any later version.\n\nThis program is distributed in the hope that it will be useful,\nbut WITHOUT ANY WARRANTY; without even the implied warranty of\nMERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\nGNU General Public License for more details.\n\nYou should have received a copy of the GNU General Public License\nalong with this program; if not, write to the Free Software\nFoundation, Inc., 51 Franklin Street, Fifth Floor, Boston,\nMA  02110-1301, USA.\n\nContact the author: comocomocomo AT users.sourceforge.net\nLatest versions: http://sourceforge.net/projects/sudoku-sensei\n-------------------------------------------------------------------\n\n");
 }
+const char *GetDefaultSymbols(int nSymbols)
+{
+	return nSymbols<=9?"123456789" :nSymbols<=30?"0123456789ABCDEFHJKLMNPRTUVWYZ":
+		nSymbols<=MAX_SYMBOLS?"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz@+":NULL;
+}
 int GetNumCells(t_board *b)
 {
 	return b->nCl;
@@ -68,13 +73,13 @@ int GetNumPossValuesOfCell(t_board *b,int cell)
 		return -1;
 	return b->pCl[cell].nPV;
 }
-int GetPossValuesOfCell(t_board *b,int cell)
+t_mask GetPossValuesOfCell(t_board *b,int cell)
 {
 	if(cell<0||cell>=b->nCl)
 		return -1;
 	return b->pCl[cell].mPV;
 }
-int GetLastRemovedPossValuesOfCell(t_board *b,int cell)
+t_mask GetLastRemovedPossValuesOfCell(t_board *b,int cell)
 {
 	if(cell<0||cell>=b->nCl)
 		return -1;
@@ -86,24 +91,17 @@ int GetSymbolOfCell(t_board *b,int cell)
 		return -1;
 	return b->pCl[cell].nPV==1?b->pCl[cell].FV:-1;
 }
-void RemovePossValuesFromCell(t_board *b,int mask,int cell)
+void RemovePossValuesFromCell(t_board *b,t_mask mask,int cell)
 {
-	int i,n,sy;
 	t_cell *c;
 	if(!b||cell<0||cell>=b->nCl||!mask)
 		return;
 	c=b->pCl+cell;
 	c->mRPV|=mask&c->mPV;					/* Backup ones to be removed */
 	c->mPV&=~mask;							/* and then remove them */
-	for(i=n=0,sy=-1;i<b->nSy;i++)
-		if(c->mPV&(1<<i))
-		{
-			n ++;							/* Count remaining possible values */
-			sy=i;							/* and remember one of them */
-		}
-	c->nPV=n;
-	if(n==1)								/* If only one symbol is possible now, */
-		c->FV=sy;							/* save it */
+	c->nPV=MASK_COUNT(c->mPV);				/* Count remaining possible values */
+	if(c->nPV==1)							/* If only one symbol is possible now, */
+		c->FV=MASK_LOWEST(c->mPV);			/* save it */
 	if(!(c->flags&DIRTY_FLAG))				/* If the cell */
 	{										/* is clean, */
 		ListExtract(&b->CleanCL,&c->lnode);	/* move it to the dirty cells list */
@@ -119,7 +117,7 @@ int SetSymbolInCell(t_board *b,int val,int cell)
 	if(!b||cell<0||cell>=b->nCl||val<0||val>=b->nSy)
 		return 0;
 	c=b->pCl+cell;
-	if(!b||b->state!=unsolved ||!b->pCl ||cell<0||cell>=b->nCl||val<0||val>=b->nSy||!((1<<val)&c->mPV))
+	if(!b||b->state!=unsolved ||!b->pCl ||cell<0||cell>=b->nCl||val<0||val>=b->nSy||!(MASK_BIT(val)&c->mPV))
 																/* If any parameter is wrong or the value is not possible... */
 		return 0;												/* ...error */
 	if(ListGetNum(&b->DirtyCL))									/* If there are already dirty */
@@ -128,12 +126,12 @@ int SetSymbolInCell(t_board *b,int val,int cell)
 			g=c->ppGr[i];
 																/* If any other cell in */
 			for(j=0;j<b->nSy;j++)								/* one of the groups of */
-				if(g->ppCl[j]!=c&&g->ppCl[j]->mPV==(1<<val))	/* this cell, can only have this value... */
+				if(g->ppCl[j]!=c&&g->ppCl[j]->mPV==MASK_BIT(val))	/* this cell, can only have this value... */
 					return 0;									/* ...error */
 		}
 																/* If there are no dirty cells, we can trust the */
 																/* "possible values" stored in the cell (already checked) */
-	RemovePossValuesFromCell(b,~(1<<val),c-b->pCl);
+	RemovePossValuesFromCell(b,~MASK_BIT(val),c-b->pCl);
 	if(!(c->flags&SOLVED_FLAG))									/* Only if not solved */
 	{
 		c->flags|=SOLVED_FLAG;									/* This cell is solved */
@@ -199,11 +197,11 @@ int GetNumSymbols(t_board *b)
 {
 	return b->nSy;
 }
-int GetErrSymbolMask(t_board *b)
+t_mask GetErrSymbolMask(t_board *b)
 {
 	return b->errmSy;
 }
-int GetErrCellMask(t_board *b)
+t_mask GetErrCellMask(t_board *b)
 {
 	return b->errmCl;
 }
@@ -241,11 +239,11 @@ int GetLastRuleIntersectedGroup(t_board *b)
 {
 	return b->ruleIGr;
 }
-int GetLastRuleCellsMask(t_board *b)
+t_mask GetLastRuleCellsMask(t_board *b)
 {
 	return b->rulemCl;
 }
-int GetLastRuleSymbolsMask(t_board *b)
+t_mask GetLastRuleSymbolsMask(t_board *b)
 {
 	return b->rulemSy;
 }
@@ -270,7 +268,7 @@ void PrintBoard(t_board *b,FILE *pf,const char *symbols,const char *empty)
 	int x,y;
 	t_cell *c;
 	if(!symbols||!*symbols)
-		symbols=b->nSy<=9?"123456789" :b->nSy<=30?"0123456789ABCDEFHJKLMNPRTUVWYZ":NULL;
+		symbols=GetDefaultSymbols(b->nSy);
 	if(!empty||!*empty||!empty[1])
 		empty=".X";
 	if(!b||b->state==skeleton||!pf||!symbols)
@@ -301,7 +299,7 @@ void PrintHTMLBoard(t_board *b,FILE *pf,const char *symbols,const char *empty)
 	int x[2],y[2];
 	t_cell *c;
 	if(!symbols||!*symbols)
-		symbols=b->nSy<=9?"123456789" :b->nSy<=30?"0123456789ABCDEFHJKLMNPRTUVWYZ":NULL;
+		symbols=GetDefaultSymbols(b->nSy);
 	if(!empty||!*empty||!empty[1])
 		empty=".X";
 	if(!b||b->state==skeleton||!pf||!symbols)
@@ -347,9 +345,7 @@ void PrintBoardPV (t_board * b,
   t_cell * c;
 
   if (!symbols || !*symbols)
-    symbols = b->nSy<=9 ? "123456789" :
-              b->nSy<=30 ? "0123456789ABCDEFHJKLMNPRTUVWYZ" :
-              NULL;
+    symbols = GetDefaultSymbols (b->nSy);
 
   if (!empty || !*empty || !empty[1] || !empty[2])
     empty = ".X*";
@@ -388,9 +384,9 @@ void PrintBoardPV (t_board * b,
               else
                 fputc (' ', pf);
             }
-            else if ((1<<s) & c->mPV)
+            else if (MASK_BIT(s) & c->mPV)
               fputc (symbols[s], pf);
-            else if ((1<<s) & c->mRPV)
+            else if (MASK_BIT(s) & c->mRPV)
               fputc (empty[2], pf);
             else
               fputc (empty[0], pf);
@@ -417,9 +413,7 @@ int ReadBoard (t_board * b,
   t_cell * c;
 
   if (!symbols || !*symbols)
-    symbols = b->nSy<=9 ? "123456789" :
-              b->nSy<=30 ? "0123456789ABCDEFHJKLMNPRTUVWYZ" :
-              NULL;
+    symbols = GetDefaultSymbols (b->nSy);
 
   if (!empty || !*empty)
     empty = ".X0";
@@ -486,9 +480,7 @@ void GetBoardRaw (t_board * b,
   t_cell * c;
 
   if (!symbols || !*symbols)
-    symbols = b->nSy<=9 ? "123456789" :
-              b->nSy<=30 ? "0123456789ABCDEFHJKLMNPRTUVWYZ" :
-              NULL;
+    symbols = GetDefaultSymbols (b->nSy);
 
   if (!empty || !*empty || !empty[1])
     empty = ".X";
@@ -521,9 +513,7 @@ int SetBoard (t_board * b,
   t_cell * c;
 
   if (!symbols || !*symbols)
-    symbols = b->nSy<=9 ? "123456789" :
-              b->nSy<=30 ? "0123456789ABCDEFHJKLMNPRTUVWYZ" :
-              NULL;
+    symbols = GetDefaultSymbols (b->nSy);
 
   if (!empty || !*empty)
     empty = ".X0";
@@ -33,133 +33,122 @@ Latest versions: http://sourceforge.net/projects/sudoku-sensei
 
 /*///////////////////////////////////////////////////////////////// */
 
-t_board *AllocateBoardSkeleton(int nCells,int nGroups,int nSymbols,int Width,int Height,int BlockWidth,int BlockHeight)
+/* A board lives in one single block of memory (the arena): the board */
+/* itself, then everything that solving modifies (cells, groups, */
+/* lists and the masks of possible cells of all the groups, symbol */
+/* after symbol), then the guessing stacks, and then the scratch */
+/* and topology arrays whose size is known beforehand. */
+/* The arrays built by CompleteBoard() take a second block. */
+/* The trail of changes made while guessing takes a third one, */
+/* allocated on the first guess and grown when it runs short (see */
+/* GrowTrail()), since most boards never guess, and the worst case */
+/* is large for big boards. */
+
+#define ARENA_ALIGN(n)  (((n) + sizeof(t_mask) - 1) / sizeof(t_mask) \
+                                                 * sizeof(t_mask))
+
+static void * TakeFromArena (char * base, size_t * size, size_t n)
 {
-	int i;
-	t_board *b;
-	t_group *g;
-	void **p,**q;
-	char ok;
-
-  b = (t_board*) malloc (sizeof(t_board));             /* Board */
-
-  if (!b)
-    return NULL;  /* Failure (not enough free memory) */
-
-  ok = TRUE;
-  memset (b, 0L, sizeof(t_board));
-
-  b->state = skeleton;
-
-  b->pInd = (char*) malloc (nSymbols*sizeof(char));
+  void * p;
 
-  if (!b->pInd)
-    ok = FALSE;
+  p = base ? base + *size : NULL;  /* Just measure if there's no */
+  *size += ARENA_ALIGN(n);         /* arena yet */
 
-  b->nCl = nCells;
-  b->pCl = (t_cell*) malloc (b->nCl*sizeof(t_cell));   /* Cells */
-
-  if (b->pCl)
-    memset (b->pCl, 0L, b->nCl*sizeof(t_cell));
-  else
-    ok = FALSE;
+  return p;
+}
 
-  b->nGr = nGroups;
-  b->nSy = nSymbols;
-  b->pGr = (t_group*) malloc (b->nGr*sizeof(t_group)); /* Groups */
+static size_t LayOutArena (t_board * b, char * base)
+{
+  int i;
+  size_t size;
+  t_mask * pmPC;
+  char * pnPC;
+  t_cell ** ppCl;
+  t_group * g;
+  void ** p, ** q;
+
+  size = ARENA_ALIGN(sizeof(t_board));   /* The board comes first */
+
+  b->pCl = (t_cell*) TakeFromArena (base, &size,      /* Cells */
+                                    b->nCl*sizeof(t_cell));
+  b->pGr = (t_group*) TakeFromArena (base, &size,     /* Groups */
+                                     b->nGr*sizeof(t_group));
+  b->pDirtyGL = (t_list*) TakeFromArena (base, &size,
+                                         b->nSy*sizeof(t_list));
+
+  pmPC = (t_mask*) TakeFromArena (base, &size,   /* Every group has */
+                                  b->nGr*b->nSy* /* a mask with */
+                                  sizeof(t_mask)); /* possible cells */
+  pnPC = (char*) TakeFromArena (base, &size,     /* and a number of */
+                                b->nGr*b->nSy*   /* possible cells */
+                                sizeof(char));   /* for every symbol */
+  b->szState = size;
+
+  b->pnGssCl = (short*) TakeFromArena (base, &size,
+                                       b->nCl*sizeof(short));
+  b->pmPGss = (t_mask*) TakeFromArena (base, &size,
+                                       b->nCl*sizeof(t_mask));
+  b->pnTrlGss = (int*) TakeFromArena (base, &size,
+                                      b->nCl*sizeof(int));
+
+  b->pInd = (char*) TakeFromArena (base, &size, b->nSy*sizeof(char));
+
+  b->pppCl = (t_cell***) TakeFromArena (base, &size,  /* 2D matrix */
+                                        b->h*sizeof(t_cell**) + /* for */
+                                        b->h*b->w*      /* easy printing */
+                                        sizeof(t_cell*)); /* (and fast) */
+
+  ppCl = (t_cell**) TakeFromArena (base, &size,  /* Pointers to the */
+                                   b->nGr*b->nSy* /* cells of every */
+                                   sizeof(t_cell*)); /* group */
+  b->szArena = size;
+
+  if (base)
+  {
+    p = (void**) b->pppCl;     /* One single block is used */
+    q = p + b->h;              /* for the array of pointers to */
+                               /* the rows, and the rows */
+    for (i=0; i<b->h; i++, p++, q+=b->w)
+      *p = q;
 
-  if (b->pGr)
-    memset (b->pGr, 0L, b->nGr*sizeof(t_group));
-  else
-    ok = FALSE;
+    for (i=0, g=b->pGr; i<b->nGr; i++, g++)
+    {
+      g->ppCl = ppCl + i*b->nSy;
+      g->pmPC = pmPC + i*b->nSy;
+      g->pnPC = pnPC + i*b->nSy;
+    }
+  }
 
-  b->pDirtyGL = (t_list*) malloc (b->nSy*sizeof(t_list));
+  return size;
+}
 
-  if (b->pDirtyGL)
-    memset (b->pDirtyGL, 0L, b->nSy*sizeof(t_list));
-  else
-    ok = FALSE;
+t_board *AllocateBoardSkeleton(int nCells,int nGroups,int nSymbols,int Width,int Height,int BlockWidth,int BlockHeight)
+{
+	t_board *b,shape;
 
-  b->w = Width;
-  b->h = Height;
+  memset (&shape, 0L, sizeof(t_board));
 
-  b->wb = BlockWidth;
-  b->hb = BlockHeight;
+  shape.nCl = nCells;
+  shape.nGr = nGroups;
+  shape.nSy = nSymbols;
 
-  b->pppCl = (t_cell***)                          /* 2D matrix */
-             malloc (b->h*sizeof(t_cell**) +      /* for easy */
-                     b->h*b->w*sizeof(t_cell*));  /* printing */
-                                                  /* (and fast) */
-  if (b->pppCl)
-  {                            /* One single block is used */
-    p = (void**) b->pppCl;     /* for the array of pointers to */
-    q = p + b->h;              /* the rows, and the rows */
+  shape.w = Width;
+  shape.h = Height;
 
-    memset (q, 0L, b->h*b->w*sizeof(t_cell*));
+  shape.wb = BlockWidth;
+  shape.hb = BlockHeight;
 
-    for (i=0; i<b->h; i++, p++, q+=b->w)
-      *p = q;
-  }
-  else
-    ok = FALSE;
+  b = (t_board*) malloc (LayOutArena(&shape, NULL)); /* Measure it */
 
-  for (i=0, g=b->pGr; ok && i<b->nGr; i++, g++) /* Every group has */
-  {
-    g->ppCl = (t_cell**) malloc (b->nSy*           /* pointers */
-                                 sizeof(t_cell*)); /* to its cells */
-
-    if (g->ppCl)
-      memset (g->ppCl, 0L, b->nSy*
-                           sizeof(t_cell*));
-    else
-      ok = FALSE;
-
-    g->pmPC = (int*) malloc (b->nSy*         /* a mask with */
-                             sizeof(int));   /* possible cells */
-                                             /* for every symbol */
-    if (g->pmPC)
-      memset (g->pmPC, 0L, b->nSy*
-                           sizeof(int));
-    else
-      ok = FALSE;
-
-    g->pnPC = (char*) malloc (b->nSy*        /* a number of */
-                              sizeof(char)); /* possible cells */
-                                             /* for every symbol */
-    if (g->pnPC)
-      memset (g->pnPC, 0L, b->nSy*
-                           sizeof(char));
-    else
-      ok = FALSE;
-  }
+  if (!b)
+    return NULL;  /* Failure (not enough free memory) */
 
-  b->pnGssCl = (short*) malloc (b->nCl*sizeof(short));
-  b->pmPGss = (int*) malloc (b->nCl*sizeof(int));
+  memset (b, 0L, shape.szArena);
+  memcpy (b, &shape, sizeof(t_board));
 
-  if (!b->pnGssCl || !b->pmPGss)
-    ok = FALSE;
+  LayOutArena (b, (char*) b);   /* Now place every array */
 
-  if (!ok)           /* If something was wrong, roll back */
-  {
-    if (b->pGr)
-      for (i=0, g=b->pGr; i<b->nGr; i++, g++)
-      {
-        free (g->ppCl);
-        free (g->pmPC);
-        free (g->pnPC);
-      }
-
-    free (b->pInd);
-    free (b->pCl);
-    free (b->pGr);
-    free (b->pDirtyGL);
-    free (b->pppCl);
-    free (b->pnGssCl);
-    free (b->pmPGss);
-    free (b);
-
-    return NULL;  /* Failure (not enough free memory) */
-  }
+  b->state = skeleton;
 
   return b;       /* Success */
 }
@@ -168,60 +157,44 @@ t_board *AllocateBoardSkeleton(int nCells,int nGroups,int nSymbols,int Width,int
 
 int CompleteBoard (t_board *b)
 {
-  int cell, group, Igroup, n, ng, i, j, k, m;
+  int cell, group, Igroup, n, ng, nIg, i, j, k, m;
   t_cell * c;
   t_group * g;
+  t_group ** ppGr;
+  t_mask * pmICl;
+  char * pC;
 
   if (!b)
     return 0;
 
   n = b->nSy;
 
-  for (cell=0; cell<b->nCl; cell++)  /* For every cell, fill its */
-  {                                  /* array of pointers to the */
-    c = b->pCl + cell;               /* groups it belongs to */
+  free (b->pTopo);      /* Reset the topology arrays */
+  b->pTopo = NULL;      /* just in case */
+
+  for (cell=ng=0; cell<b->nCl; cell++)  /* For every cell, count */
+  {                                     /* the groups it belongs to */
+    c = b->pCl + cell;
 
-    free (c->ppGr);     /* Reset group arrays */
-    free (c->pxGr);     /* just in case */
     c->ppGr = NULL;
     c->pxGr = NULL;
     c->nGr = 0;
 
-    for (group=ng=0; group<b->nGr; group++)  /* For every group */
+    for (group=0; group<b->nGr; group++)     /* For every group */
       for (i=0; i<n; i++)
         if (b->pGr[group].ppCl[i]==c)        /* If the cell is */
         {                                    /* in it, count */
-          ng ++;                             /* and skip to next */
+          c->nGr ++;                         /* and skip to next */
           break;                             /* group */
         }
-           /* Now ng is the number of groups that contain this cell */
-           /* Allocate space enough for the array... */
 
-    c->ppGr = (t_group**) malloc (ng*sizeof(t_group*));
-    c->pxGr = (char*) malloc (ng*sizeof(char));
-
-    if (!c->ppGr || !c->pxGr)
-      return 0;
-
-    for (group=0; group<b->nGr; group++)     /* Repeat search */
-      for (i=0; i<n; i++)                    /* and now store */
-        if (b->pGr[group].ppCl[i]==c)        /* ptrs. to groups */
-        {
-          c->ppGr[c->nGr] = b->pGr + group;
-          c->pxGr[c->nGr] = i;
-          c->nGr ++;
-          break;
-        }
+    ng += c->nGr;
   }
 
   for (group=0; group<b->nGr; group++)  /* For every group, reset */
   {                                     /* its arrays of */
     g = b->pGr + group;                 /* intersected groups */
 
-    free (g->ppIGr);    /* Reset arrays */
-    free (g->pxIGr);    /* just in case */
-    free (g->pmICl);
-    free (g->pnICl);
     g->ppIGr = NULL;
     g->pxIGr = NULL;
     g->pmICl = NULL;
@@ -229,7 +202,7 @@ int CompleteBoard (t_board *b)
     g->nIGr = 0;
   }
 
-  for (group=0; group<b->nGr; group++)            /* Count */
+  for (group=nIg=0; group<b->nGr; group++)        /* Count */
     for (Igroup=group+1; Igroup<b->nGr; Igroup++) /* intersections */
     {
       for (i=0; i<n; i++)               /* For every pair of groups */
@@ -247,28 +220,62 @@ int CompleteBoard (t_board *b)
       {
         b->pGr[group].nIGr ++;   /* Increase both */
         b->pGr[Igroup].nIGr ++;  /* intersection counters */
+        nIg += 2;
       }
     }
+              /* Now allocate one block for all the arrays: pointers */
+              /* and masks first, then the indexes and counters */
+
+  b->pTopo = malloc (ng*(sizeof(t_group*) + sizeof(char)) +
+                     nIg*(sizeof(t_group*) + sizeof(t_mask) +
+                          2*sizeof(char)));
+
+  if (!b->pTopo)
+    return 0;
+
+  ppGr = (t_group**) b->pTopo;
+  pmICl = (t_mask*) (ppGr + ng + nIg);
+  pC = (char*) (pmICl + nIg);
+
+  memset (b->pTopo, 0L, ng*(sizeof(t_group*) + sizeof(char)) +
+                        nIg*(sizeof(t_group*) + sizeof(t_mask) +
+                             2*sizeof(char)));
+
+  for (cell=0; cell<b->nCl; cell++)  /* For every cell, fill its */
+  {                                  /* array of pointers to the */
+    c = b->pCl + cell;               /* groups it belongs to */
+
+    c->ppGr = ppGr;
+    c->pxGr = pC;
+    ppGr += c->nGr;
+    pC += c->nGr;
+    c->nGr = 0;
+
+    for (group=0; group<b->nGr; group++)     /* Repeat search */
+      for (i=0; i<n; i++)                    /* and now store */
+        if (b->pGr[group].ppCl[i]==c)        /* ptrs. to groups */
+        {
+          c->ppGr[c->nGr] = b->pGr + group;
+          c->pxGr[c->nGr] = i;
+          c->nGr ++;
+          break;
+        }
+  }
 
-  for (group=0; group<b->nGr; group++)  /* For every group, */
-  {                                     /* allocate arrays of */
+  for (group=0; group<b->nGr; group++)  /* For every group, take */
+  {                                     /* its arrays of */
     g = b->pGr + group;                 /* intersected groups */
 
     if (!g->nIGr)
       continue;
-          
-    g->ppIGr = (t_group**) malloc (g->nIGr*sizeof(t_group*));
-    g->pxIGr = (char*) malloc (g->nIGr*sizeof(char));
-    g->pmICl = (int*) malloc (g->nIGr*sizeof(int));
-    g->pnICl = (char*) malloc (g->nIGr*sizeof(char));
-
-    if (!g->ppIGr || !g->pxIGr || !g->pmICl || !g->pnICl)
-      return 0;
-
-    memset (g->ppIGr, 0L, g->nIGr*sizeof(t_group*));
-    memset (g->pxIGr, 0L, g->nIGr*sizeof(char));
-    memset (g->pmICl, 0L, g->nIGr*sizeof(int));
-    memset (g->pnICl, 0L, g->nIGr*sizeof(char));
+
+    g->ppIGr = ppGr;
+    g->pmICl = pmICl;
+    g->pxIGr = pC;
+    g->pnICl = pC + g->nIGr;
+    ppGr += g->nIGr;
+    pmICl += g->nIGr;
+    pC += 2*g->nIGr;
   }
 
   b->maxICl = 0;   /* Reset max num of involved cells */
@@ -290,7 +297,7 @@ int CompleteBoard (t_board *b)
               b->pGr[Igroup].ppCl[j])  /* pair */
           {
             g->ppIGr[k] = b->pGr + Igroup; /* (may be repeated) */
-            g->pmICl[k] |= 1 << i;         /* Raise cell bit */
+            g->pmICl[k] |= MASK_BIT(i);    /* Raise cell bit */
             g->pnICl[k] ++;                /* Count cells */
 
             m = 1;  /* Raise flag "k will have to be increased */
@@ -319,9 +326,11 @@ int CompleteBoard (t_board *b)
           break;
         }
   }
+  b->maxN = b->nSy/2 < MAX_SUBSET ?     /* Subsets bigger than */
+            b->nSy/2 : MAX_SUBSET;      /* nSy/2 are not needed */
                                         /* Maximum dirty level */
-  b->maxLevel = b->maxICl > b->nSy/2 ?  /* for groups (num. of */
-                b->maxICl : b->nSy/2;   /* dirty group lists) */
+  b->maxLevel = b->maxICl > b->maxN ?   /* for groups (num. of */
+                b->maxICl : b->maxN;    /* dirty group lists) */
 
   b->state = unsolved;    /* Initial state */
   CleanBoard (b);         /* Clean it for the first time */
@@ -346,6 +355,7 @@ void CleanBoard (t_board * b)
   b->errGr = -1;                 /* No error group */
   b->nGss = 0;                   /* No guessings */
   b->nGssTotal = 0;
+  b->nTrl = 0;                   /* Empty trail */
 
   b->nRulesN1 = 0;
   b->nRulesN2 = 0;               /* Reset dificulty */
@@ -362,7 +372,7 @@ void CleanBoard (t_board * b)
   {
         /* State of solution: */
 
-    c->mPV = ~ (~0UL << b->nSy); /* All values are possible */
+    c->mPV = MASK_ALL(b->nSy);   /* All values are possible */
     c->nPV = b->nSy;
 
     c->FV = -1;       /* Final value: undefined */
@@ -382,7 +392,7 @@ void CleanBoard (t_board * b)
 
     for (j=0; j<b->nSy; j++)
     {
-      g->pmPC[j] = ~ (~0UL << b->nSy); /* All cells are possible */
+      g->pmPC[j] = MASK_ALL(b->nSy);   /* All cells are possible */
       g->pnPC[j] = b->nSy;
     }
 
@@ -400,42 +410,140 @@ void CleanBoard (t_board * b)
 
 void DestroyBoard (t_board * b)
 {
-  int i;
-  t_group * g;
-
   if (!b)
     return;
-                                  /* Just free everything */
-  if (b->pCl)                     /* carefully (any subset */
-    for (i=0; i<b->nCl; i++)      /* of pointers might be NULL) */
-    {
-      free (b->pCl[i].ppGr);
-      free (b->pCl[i].pxGr);
-    }
+                        /* The topology arrays, and then */
+  free (b->pTopo);      /* the trail, and then the arena */
+  free (b->pTrl);       /* (the board comes first) */
+  free (b);
+}
 
-  if (b->pGr)
-    for (i=0, g=b->pGr; i<b->nGr; i++, g++)
-    {
-      free (g->ppCl);
+/*///////////////////////////////////////////////////////////////// */
 
-      free (g->pmPC);
-      free (g->pnPC);
+int GrowTrail (t_board * b, int n)
+{
+  int size;
+  t_trail * p;
 
-      free (g->ppIGr);
-      free (g->pxIGr);
-      free (g->pmICl);
-      free (g->pnICl);
-    }
+  if (n <= b->nTrlMax)
+    return 1;     /* There's room already */
 
-  free (b->pInd);
-  free (b->pCl);
-  free (b->pGr);
-  free (b->pppCl);
-  free (b->pDirtyGL);
-  free (b->pnGssCl);
-  free (b->pmPGss);
+  size = 2*b->nTrlMax;  /* Grow at least twice, so the */
+  if (size < n)         /* copies take linear time */
+    size = n;
 
-  free (b);
+  p = (t_trail*) realloc (b->pTrl, size*sizeof(t_trail));
+
+  if (!p)
+    return 0;     /* Failure (not enough free memory) */
+
+  b->pTrl = p;
+  b->nTrlMax = size;
+
+  return 1;       /* Success */
+}
+
+/*///////////////////////////////////////////////////////////////// */
+
+/* A snapshot keeps a copy of the arena of a board, that holds */
+/* everything that solving modifies: cells, groups (and their masks), */
+/* lists and guessing stacks; and a copy of the used part of the */
+/* trail, grown like the trail itself. Since the topology is not */
+/* copied, a snapshot is only valid for the board it was allocated */
+/* for. */
+
+#define ARENA_OFFSET(b,p)  ((char*) (p) - (char*) (b))
+
+t_snapshot * AllocateSnapshot (t_board * b)
+{
+  t_snapshot * s;
+
+  if (!b || b->state==skeleton)
+    return NULL;
+
+  s = (t_snapshot*) malloc (sizeof(t_snapshot) + b->szArena);
+
+  if (!s)
+    return NULL;  /* Failure (not enough free memory) */
+
+  s->pArena = (char*) (s + 1);
+  s->pTrl = NULL;   /* No trail copied yet */
+  s->nTrlMax = 0;
+
+  return s;       /* Success */
+}
+
+/*///////////////////////////////////////////////////////////////// */
+
+int SaveSnapshot (t_board * b, t_snapshot * s)
+{
+  t_trail * p;
+
+  if (!b || !s || b->state==skeleton)
+    return 0;
+
+  if (b->nTrl > s->nTrlMax)     /* Make room for the trail */
+  {
+    p = (t_trail*) realloc (s->pTrl, b->nTrlMax*sizeof(t_trail));
+
+    if (!p)
+      return 0;   /* Failure (not enough free memory) */
+
+    s->pTrl = p;
+    s->nTrlMax = b->nTrlMax;
+  }
+                                        /* Board, cells, groups, */
+  memcpy (s->pArena, b, b->szState);    /* lists and masks at once */
+
+  memcpy (s->pArena + ARENA_OFFSET(b, b->pnGssCl), b->pnGssCl,
+          b->nGss*sizeof(short));       /* and the used part of */
+  memcpy (s->pArena + ARENA_OFFSET(b, b->pmPGss), b->pmPGss,
+          b->nGss*sizeof(t_mask));      /* the stacks and the */
+  memcpy (s->pArena + ARENA_OFFSET(b, b->pnTrlGss), b->pnTrlGss,
+          b->nGss*sizeof(int));         /* trail */
+  if (b->nTrl)      /* The trail may not be allocated yet */
+    memcpy (s->pTrl, b->pTrl, b->nTrl*sizeof(t_trail));
+
+  return 1;       /* Success */
+}
+
+/*///////////////////////////////////////////////////////////////// */
+
+void RestoreSnapshot (t_board * b, t_snapshot * s)
+{
+  int nTrlMax;
+  t_trail * pTrl;
+
+  if (!b || !s || b->state==skeleton)
+    return;
+
+  pTrl = b->pTrl;         /* The trail may have grown since */
+  nTrlMax = b->nTrlMax;   /* the snapshot was saved; keep it */
+                                        /* Pointers in the copy */
+  memcpy (b, s->pArena, b->szState);    /* (including list nodes) */
+                                        /* still refer to this */
+  b->pTrl = pTrl;                       /* same board */
+  b->nTrlMax = nTrlMax;
+
+  memcpy (b->pnGssCl, s->pArena + ARENA_OFFSET(b, b->pnGssCl),
+          b->nGss*sizeof(short));
+  memcpy (b->pmPGss, s->pArena + ARENA_OFFSET(b, b->pmPGss),
+          b->nGss*sizeof(t_mask));
+  memcpy (b->pnTrlGss, s->pArena + ARENA_OFFSET(b, b->pnTrlGss),
+          b->nGss*sizeof(int));
+  if (b->nTrl)      /* The trail may not be allocated yet */
+    memcpy (b->pTrl, s->pTrl, b->nTrl*sizeof(t_trail));
+}
+
+/*///////////////////////////////////////////////////////////////// */
+
+void DestroySnapshot (t_snapshot * s)
+{
+  if (!s)
+    return;
+                  /* The copy of the trail, and then the */
+  free (s->pTrl); /* snapshot (the copy of the arena comes */
+  free (s);       /* with it) */
 }
 
 /*///////////////////////////////////////////////////////////////// */
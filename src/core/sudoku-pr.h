@@ -29,12 +29,17 @@ Latest versions: http://sourceforge.net/projects/sudoku-sensei
 #define _SUDOKU_PRIVATE_H_
 
 #include "sudoku-pub.h"
+#include "sudoku-bits.h"
 #include "list.h"
 
 #define DIRTY_FLAG    1
 #define SOLVED_FLAG   2
 #define GUESSED_FLAG  4
 
+#define MAX_SUBSET    8   /* Max. N for the first rule (the search */
+                          /* grows exponentially with N, and big */
+                          /* subsets are hardly ever needed) */
+
 typedef struct s_cell * t_cell_p;
 typedef struct s_group * t_group_p;
 
@@ -46,7 +51,7 @@ typedef struct s_cell
 {
   /* Topology: */
 
-  char x, y;        /* Coordinates (just for printing) */
+  short x, y;       /* Coordinates (just for printing) */
 
   t_group_p * ppGr; /* Groups it belongs to */
   char nGr;         /* Num. of groups it belongs to */
@@ -54,7 +59,7 @@ typedef struct s_cell
 
   /* State of solution: */
 
-  int mPV;          /* Mask with possible values */
+  t_mask mPV;       /* Mask with possible values */
   char nPV;         /* Num. of possible values (redundant) */
   char FV;          /* Final value (only valid when nPV==1) */
   short nSolPos;    /* Position in solving order */
@@ -63,7 +68,7 @@ typedef struct s_cell
   /* State during solving progress: */
 
   char flags;       /* State of the cell */
-  int mRPV;         /* Mask of removed poss. values (0 when clean) */
+  t_mask mRPV;      /* Mask of removed poss. values (0 when clean) */
   t_lnode lnode;    /* Node in the clean/dirty cells list */
 }
 t_cell;
@@ -82,15 +87,15 @@ typedef struct s_group
   t_group_p * ppIGr;   /* Intersected groups */
   char nIGr;           /* Num. of intersected groups */
   char * pxIGr;        /* Cross reference indexes */
-  int * pmICl;         /* Masks indicating involved cells */
+  t_mask * pmICl;      /* Masks indicating involved cells */
   char * pnICl;        /* Nums. of involved cells */
 
   /* State of solution: */
 
-  int * pmPC;       /* Masks with possible cells for the values */
+  t_mask * pmPC;    /* Masks with possible cells for the values */
   char * pnPC;      /* Nums. of possible cells (redundant) */
-  int mDirtyCl;     /* Mask with dirty cells of the group */
-  int mDirtySy;     /* Mask with dirty symbols of the group */
+  t_mask mDirtyCl;  /* Mask with dirty cells of the group */
+  t_mask mDirtySy;  /* Mask with dirty symbols of the group */
 
   /* State during solving progress: */
 
@@ -102,6 +107,17 @@ t_group;
 
 /*/////////////////////////// */
 
+typedef struct s_trail
+{
+  short idx;        /* Index of the cell or group */
+  char sy;          /* Symbol of the group (-1 == it is a cell) */
+  char n;           /* Previous num. of possible values/cells */
+  t_mask m;         /* Previous mask of possible values/cells */
+}
+t_trail;
+
+/*/////////////////////////// */
+
 typedef struct s_board
 {
   /* Topology: */
@@ -113,6 +129,7 @@ typedef struct s_board
   short nGr;        /* Num. of groups */
   char nSy;         /* Num. of symbols (== size of every group) */
   char maxICl;      /* Max. num. of cells in a group intersection */
+  char maxN;        /* Max. N searched by the first rule */
 
   short w, h;       /* Size (width and height for printing) */
   char wb, hb;      /* Size of blocks for printing */
@@ -122,8 +139,8 @@ typedef struct s_board
 
   e_state state;    /* skeleton, unsolved, impossible, solved */
   short nSol;       /* Num. of solved cells */
-  short errmSy;     /* Symbols with too few/many possible cells */
-  short errmCl;     /* Cells with too few/many possible symbols */
+  t_mask errmSy;    /* Symbols with too few/many possible cells */
+  t_mask errmCl;    /* Cells with too few/many possible symbols */
   short errGr;      /* Group with error */
 
   /* State during solving progress: */
@@ -138,23 +155,51 @@ typedef struct s_board
   char * pInd;      /* Index array used in ProcessDirtyGroup() */
 
   short * pnGssCl;  /* Stack of guessed cells */
-  int * pmPGss;     /* Stack of masks with values pending to try */
+  t_mask * pmPGss;  /* Stack of masks with values pending to try */
   int nGss;         /* Num. of guessed cells (top of the stack) */
   int nGssTotal;    /* Num. of guess op. (count failures too) */
 
+  t_trail * pTrl;   /* Trail of changes made while guessing */
+  int nTrl;         /* Num. of changes in the trail */
+  int nTrlMax;      /* Room in the trail (grown while guessing) */
+  int * pnTrlGss;   /* Stack of trail positions (one per guess) */
+
   char ruleLevel;   /* Level of last rule applied */
   e_rule ruleType;  /* Type of last rule applied */
   short ruleGr;     /* Group of last rule applied */
   short ruleIGr;    /* Intersected group of last rule applied */
-  int rulemSy;      /* Involved symbols in last rule applied */
-  int rulemCl;      /* Involved cells in last rule applied */
+  t_mask rulemSy;   /* Involved symbols in last rule applied */
+  t_mask rulemCl;   /* Involved cells in last rule applied */
 
   short nRulesN1;   /* Number of rules with N=1 */
   short nRulesN2;   /* Number of rules with N=2 */
   short nRulesNGt2; /* Number of rules with N>2 */
+
+  /* Memory: */
+
+  size_t szState;   /* Bytes at the start of the arena that solving */
+                    /* modifies (but the stacks) */
+  size_t szArena;   /* Bytes of the arena (the board comes first) */
+  void * pTopo;     /* Block with the arrays built by CompleteBoard() */
 }
 t_board;
 
 /*/////////////////////////// */
 
+typedef struct s_snapshot
+{
+  char * pArena;      /* Copy of the arena of the board (only the */
+                      /* used part of the stacks) */
+  t_trail * pTrl;     /* Copy of the used part of the trail */
+  int nTrlMax;        /* Room in the copy of the trail */
+}
+t_snapshot;
+
+/*/////////////////////////// */
+
+int GrowTrail (t_board * b, int n);  /* Make room for n changes in */
+                                     /* the trail (sudoku-mem.c) */
+
+/*/////////////////////////// */
+
 #endif
@@ -35,7 +35,16 @@ Latest versions: http://sourceforge.net/projects/sudoku-sensei
 #define TRUE   1
 #define FALSE  0
 
+typedef unsigned long long t_mask;  /* One bit per symbol (or per */
+                                    /* cell of a group) */
+#define MAX_SYMBOLS  64
+
+#define MASK_BIT(i)  ((t_mask) 1 << (i))
+#define MASK_ALL(n)  ((n)>=MAX_SYMBOLS ? ~ (t_mask) 0 : \
+                                          MASK_BIT(n) - 1)
+
 typedef struct s_board * t_board_p;
+typedef struct s_snapshot * t_snapshot_p;
 
 typedef enum e_e_state  /* Possible states for a sudoku board */
 {
@@ -93,6 +102,16 @@ void CleanBoard (t_board_p b);
 
 void DestroyBoard (t_board_p b);
 
+/* Save/restore the state of a board (not its topology) */
+
+t_snapshot_p AllocateSnapshot (t_board_p b);
+
+int SaveSnapshot (t_board_p b, t_snapshot_p s);  /* 0 == failure */
+
+void RestoreSnapshot (t_board_p b, t_snapshot_p s);
+
+void DestroySnapshot (t_snapshot_p s);
+
 /*/////////////////////////////////////////////////////////////// */
 /* sudoku-iface.c */
 /* Trivial functions to access data */
@@ -100,6 +119,10 @@ void DestroyBoard (t_board_p b);
 
 void PrintGPL (FILE * pf);
 
+/* Symbols used when none are given (NULL if there are too many) */
+
+const char * GetDefaultSymbols (int nSymbols);
+
 /* Cell data */
 
 int GetNumCells (t_board_p b);
@@ -110,12 +133,12 @@ int GetCellNumber (t_board_p b, int x, int y);
 int CellWasChangedByLastRule (t_board_p b, int cell);
 
 int GetNumPossValuesOfCell (t_board_p b, int cell);
-int GetPossValuesOfCell (t_board_p b, int cell);
-int GetLastRemovedPossValuesOfCell (t_board_p b, int cell);
+t_mask GetPossValuesOfCell (t_board_p b, int cell);
+t_mask GetLastRemovedPossValuesOfCell (t_board_p b, int cell);
 int GetSymbolOfCell (t_board_p b, int cell);
 
 void RemovePossValuesFromCell (t_board_p b,
-                               int mask,
+                               t_mask mask,
                                int cell);
 
 int SetSymbolInCell (t_board_p b,
@@ -141,8 +164,8 @@ e_state GetState (t_board_p b);
 int GetNumSolvedCells (t_board_p b);
 int GetNumSymbols (t_board_p b);
 
-int GetErrSymbolMask (t_board_p b);
-int GetErrCellMask (t_board_p b);
+t_mask GetErrSymbolMask (t_board_p b);
+t_mask GetErrCellMask (t_board_p b);
 int GetErrGroup (t_board_p b);
 
 int GetNumGuessedCells (t_board_p b);
@@ -153,8 +176,8 @@ int GetLastRuleLevel (t_board_p b);
 e_rule GetLastRuleType (t_board_p b);
 int GetLastRuleGroup (t_board_p b);
 int GetLastRuleIntersectedGroup (t_board_p b);
-int GetLastRuleCellsMask (t_board_p b);
-int GetLastRuleSymbolsMask (t_board_p b);
+t_mask GetLastRuleCellsMask (t_board_p b);
+t_mask GetLastRuleSymbolsMask (t_board_p b);
 
 int GetNumRulesN1 (t_board_p b);
 int GetNumRulesNGt1 (t_board_p b);
@@ -203,6 +226,19 @@ int Solve (t_board_p b,    /* Puzzle to solve */
            char bguess);   /* TRUE  == "guess if needed" */
                            /* FALSE == "do not guess" */
 
+                           /* Returns the num. of guessed cells */
+                           /* (-1 == not enough memory to guess) */
+
+/*/////////////////////////////////////////////////////////////// */
+/* sudoku-count.c */
+/* Counting solutions by backtracking (for uniqueness checks) */
+/*/////////////////////////////////////////////////////////////// */
+
+int CountSolutions (t_board_p b,   /* Puzzle to check */
+
+                    int limit);    /* Stop after finding this many */
+                                   /* solutions (0 == count all) */
+
 /*/////////////////////////////////////////////////////////////// */
 /* sudoku-grids.c */
 /* Functions for building boards */
@@ -43,8 +43,11 @@ static INLINE int ProcessDirtyGroup (t_board * b);
 
 static INLINE void RemovePossibleValuesFromCell (t_board * b,
                                                  t_cell * c,
-                                                 int m);
+                                                 t_mask m);
 
+static INLINE void PushTrail (t_board * b, int idx, int sy,
+                              t_mask m, int n);
+static INLINE int ReserveTrail (t_board * b);
 static INLINE void SearchCandidateCellForGuessing (t_board * b);
 static INLINE void TakeNextUnexploredGuess (t_board * b);
 static INLINE void RewindGuess (t_board * b);
@@ -108,12 +111,18 @@ int Solve (t_board * b,    /* Puzzle to solve */
         return b->nGss;            /* No options remain...    end */
 
       RecoverPrevStateForGuessing (b);  /* Remove effects of */
-                                        /* the wrong guess */
-    }
+                                        /* the wrong guess (the */
+    }                                   /* room reserved in the */
+                                        /* trail for it is enough */
+                                        /* for the next option) */
                                    /* If there _might_ be a sol. */
     else  /* state==unsolved          search what to guess */
+    {
+      if (!ReserveTrail(b))        /* Not enough memory to */
+        return -1;                 /* guess...                end */
 
       SearchCandidateCellForGuessing (b);
+    }
 
 
     TakeNextUnexploredGuess (b);  /* Finally, guess */
@@ -130,6 +139,7 @@ int Solve (t_board * b,    /* Puzzle to solve */
 static INLINE int ProcessDirtyCell (t_board * b)
 {
   int i, j, val, dirty;
+  t_mask m;
   t_cell * c;
   t_group * g;
   t_lnode * node;
@@ -145,7 +155,7 @@ static INLINE int ProcessDirtyCell (t_board * b)
   if (c->nPV==0)  /* If there's no possible value at all */
   {
     b->errGr = c->ppGr[0] - b->pGr; /* Save error information */
-    b->errmCl = 1 << c->pxGr[0];    /* and give up :-( */
+    b->errmCl = MASK_BIT(c->pxGr[0]); /* and give up :-( */
     b->errmSy = 0;
     b->state = impossible;          
     return 0;
@@ -172,20 +182,28 @@ static INLINE int ProcessDirtyCell (t_board * b)
     g = c->ppGr[i];
     j = c->pxGr[i];    /* Cell's index inside the group */
 
-    for (val=dirty=0; val<b->nSy; val++)  /* Now remove the cell */
-      if (((1<<val) & c->mRPV) &&         /* from the masks of the */
-          ((1<<j) & g->pmPC[val]))        /* removed possible */
+    for (m=c->mRPV, dirty=0; m; m=MASK_NEXT(m))
+    {
+      val = MASK_LOWEST(m);               /* Now remove the cell */
+                                          /* from the masks of the */
+      if (MASK_BIT(j) & g->pmPC[val])     /* removed possible */
       {                                   /* values */
-        g->pmPC[val] &= ~ (1<<j);
+        if (b->nGss)                      /* (saving the old ones */
+          PushTrail (b, g - b->pGr, val,  /* if they might be */
+                     g->pmPC[val],        /* restored later) */
+                     g->pnPC[val]);
+
+        g->pmPC[val] &= ~ MASK_BIT(j);
         g->pnPC[val] --;
-        g->mDirtySy |= 1 << val;
+        g->mDirtySy |= MASK_BIT(val);
 
         dirty = 1;       /* Bits channged, so raise the flag */
       }
+    }
 
     if (dirty)
     {
-      g->mDirtyCl |= 1 << j;
+      g->mDirtyCl |= MASK_BIT(j);
                                                 /* If any bit */
       if (!(g->flags & DIRTY_FLAG) || g->level) /* changed, mark */
       {                                         /* the group dirty */
@@ -209,7 +227,8 @@ static INLINE int ProcessDirtyCell (t_board * b)
 
 static INLINE int ProcessDirtyGroup (t_board * b)
 {
-  int i, j, k, m, n, o, p, mc, ms;
+  int i, j, k, n, o, p;
+  t_mask m, mc, ms, mt;
   char level, sy, N, dirty;
   char * pInd;
   t_group * g, * Ig;
@@ -247,13 +266,13 @@ static INLINE int ProcessDirtyGroup (t_board * b)
 
   /* Part A: (N symbols appear in only N cells..) */
 
-  if (level<b->nSy/2 && g->mDirtySy)
+  if (level<b->maxN && g->mDirtySy)
   {
     b->ruleType = symbols;
 
     for (i=n=0; i<b->nSy; i++)      /* Count the number of symbols */
       if (g->pnPC[i]<=N &&          /* that can appear in N (or */
-          ((1<<i) & g->mDirtySy) && /* less) different cells of */
+          (MASK_BIT(i) & g->mDirtySy) && /* less) different cells of */
           (N==1 || g->pnPC[i]>1))   /* the group and make an index */
       {
         pInd[n] = i;
@@ -262,7 +281,7 @@ static INLINE int ProcessDirtyGroup (t_board * b)
                                   /* impossible in dirty cells */
     for (i=0, p=n; i<b->nSy; i++) /* (dirty symbols) */
       if (g->pnPC[i]<=N &&
-          !((1<<i) & g->mDirtySy) &&
+          !(MASK_BIT(i) & g->mDirtySy) &&
           g->pnPC[i]>1)
       {
         pInd[n] = i;              /* (p: number of dirty symbols) */
@@ -277,19 +296,17 @@ static INLINE int ProcessDirtyGroup (t_board * b)
 
       for (;;)
       {
-        for (i=mc=0; i<n; i++)       /* (mc: mask indicating */
-          if (m & (1<<i))            /*      subset of cells of */
-            mc |= g->pmPC[pInd[i]];  /*      the group where the */
-                                     /*      symbols are possible) */
-        for (j=0, i=mc; i; i>>=1)
-          if (i & 1)                 /* (j: number of cells) */
-            j ++;
+        for (mt=m, mc=0; mt; mt=MASK_NEXT(mt)) /* (mc: mask */
+          mc |= g->pmPC[pInd[MASK_LOWEST(mt)]]; /* indicating subset */
+                                     /*      of cells of the group */
+                                     /*      where the symbols are */
+        j = MASK_COUNT(mc);          /*      possible) */
+                                     /* (j: number of cells) */
                            /* N symbols that can appear in */
         if (o==N && j<=N)  /* only N (or less) cells... */
         {
-          for (i=ms=0; i<n; i++)     /* (ms: mask with N symbols) */
-            if (m & (1<<i))
-              ms |= 1 << pInd[i];
+          for (mt=m, ms=0; mt; mt=MASK_NEXT(mt)) /* (ms: mask with */
+            ms |= MASK_BIT(pInd[MASK_LOWEST(mt)]); /* N symbols) */
 
           if (j<N)                   /* If N symbols can only be */
           {                          /* in _less_ than N cells, */
@@ -305,7 +322,7 @@ static INLINE int ProcessDirtyGroup (t_board * b)
             {                        /* symbol will be possible */
               c = g->ppCl[i];        /* in these cells */
 
-              if (((1<<i) & mc)  &&    /* If the possible symbols */
+              if ((MASK_BIT(i) & mc)  && /* If the possible symbols */
                   (~ms & c->mPV)    )  /* mask of the cell */
               {                        /* includes other symbols */
 
@@ -314,7 +331,7 @@ static INLINE int ProcessDirtyGroup (t_board * b)
                 if (c->nPV==0)         /* No possible symbol... */
                 {
                   b->errGr = g - b->pGr;
-                  b->errmCl = 1 << i;
+                  b->errmCl = MASK_BIT(i);
                   b->errmSy = 0;
                   b->state = impossible; /* There's no solution */
                   return 0;              /* Stop solving */
@@ -343,29 +360,30 @@ static INLINE int ProcessDirtyGroup (t_board * b)
           }             /* with groups */
         }
                                    /* Next subset: */
-        if (o==N || j>N || k==n-1) /* If there are already N */
-        {                          /* symbols, or they might be */
-          m &= ~ (1<<k);           /* in more than N cells, or the */
-          o --;                    /* last added is the last we */
-                                   /* have... remove it */
-          if (k==n-1)                 
-          {                        /* If there are not more... */
+        if (o==N || j>N ||         /* If there are already N */
+            o+n-1-k<N)             /* symbols, or they might be */
+        {                          /* in more than N cells, or the */
+          m &= ~ MASK_BIT(k);      /* symbols left can't make N */
+          o --;                    /* anymore... remove the last */
+                                   /* added */
+          if (o+n-1-k<N)           /* If no symbol after it can */
+          {                        /* make N either... */
             if (!o)
               break;               /* Empty hands... end */
 
-            do k--; while (!(m & (1<<k))); /* Go back to the */
+            do k--; while (!(m & MASK_BIT(k))); /* Go back to the */
                                            /* previous symbol */
-            m &= ~ (1<<k);                 /* and remove it */
+            m &= ~ MASK_BIT(k);            /* and remove it */
             o --;
           }
         }
                       /* Move left and add the next symbol */
         k ++;
-        m |= 1 << k;  /* Don't wait to have N symbols: go up */
+        m |= MASK_BIT(k); /* Don't wait to have N symbols: go up */
         o ++;         /* and count the cells... (it saves time) */
 
-        if (!(m & ((1<<p)-1)) ||     /* If there's no hope to have */
-            !(m & ((1<<(n-N+1))-1))) /* a subset of N symbols with */
+        if (!(m & MASK_ALL(p)) ||    /* If there's no hope to have */
+            !(m & MASK_ALL(n-N+1)))  /* a subset of N symbols with */
           break;                     /* at least one dirty symbol, */
       }                              /* stop */
     }
@@ -373,13 +391,13 @@ static INLINE int ProcessDirtyGroup (t_board * b)
 
     /* Part B (N cells can only have N symbols..) */
 
-  if (level<b->nSy/2 && g->mDirtyCl)
+  if (level<b->maxN && g->mDirtyCl)
   {
     b->ruleType = cells;
 
     for (i=n=0; i<b->nSy; i++)      /* Count the number of cells */
       if (g->ppCl[i]->nPV<=N &&     /* of the group where N (or */
-          ((1<<i) & g->mDirtyCl) && /* less) different symbols */
+          (MASK_BIT(i) & g->mDirtyCl) && /* less) different symbols */
           (N==1 ||                  /* can be and make an index */
            g->ppCl[i]->nPV>1))
       {
@@ -389,7 +407,7 @@ static INLINE int ProcessDirtyGroup (t_board * b)
                                   /* have heen dirty since last */
     for (i=0, p=n; i<b->nSy; i++) /* visit to this group */
       if (g->ppCl[i]->nPV<=N &&
-          !((1<<i) & g->mDirtyCl) &&
+          !(MASK_BIT(i) & g->mDirtyCl) &&
           g->ppCl[i]->nPV>1)
       {
         pInd[n] = i;
@@ -404,20 +422,17 @@ static INLINE int ProcessDirtyGroup (t_board * b)
 
       for (;;)
       {
-        for (i=ms=0; i<n; i++)       /* (ms: mask indicating */
-          if (m & (1<<i))            /*      subset of symbols */
-            ms |= g->                /*      possible in the */
-                 ppCl[pInd[i]]->mPV; /*      chosen cells) */
-
-        for (j=0, i=ms; i; i>>=1)
-          if (i & 1)                 /* (j: number of symbols) */
-            j ++;
+        for (mt=m, ms=0; mt; mt=MASK_NEXT(mt)) /* (ms: mask */
+          ms |= g->ppCl[pInd[MASK_LOWEST(mt)]]->mPV; /* indicating */
+                                     /*      subset of symbols */
+                                     /*      possible in the */
+        j = MASK_COUNT(ms);          /*      chosen cells) */
+                                     /* (j: number of symbols) */
                              /* N cells that can have only N */
         if (o==N && j<=N)    /* (or less) different symbols... */
         {
-          for (i=mc=0; i<n; i++)     /* (ms: mask with N cells) */
-            if (m & (1<<i))
-              mc |= 1 << pInd[i];
+          for (mt=m, mc=0; mt; mt=MASK_NEXT(mt)) /* (mc: mask with */
+            mc |= MASK_BIT(pInd[MASK_LOWEST(mt)]); /* N cells) */
 
           if (j<N)                   /* If the number of possible */
           {                          /* symbols in N cells is */
@@ -433,7 +448,7 @@ static INLINE int ProcessDirtyGroup (t_board * b)
             {                        /* not be possible in any */
               c = g->ppCl[i];        /* other cells of the group */
 
-              if (!((1<<i) & mc) &&    /* If the possible symbols */
+              if (!(MASK_BIT(i) & mc) && /* If the possible symbols */
                   (ms & c->mPV)     )  /* mask of the cell */
               {                        /* includes any one of */
                                        /* these N symbols */
@@ -443,7 +458,7 @@ static INLINE int ProcessDirtyGroup (t_board * b)
                 if (c->nPV==0)         /* No possible symbol... */
                 {
                   b->errGr = g - b->pGr;
-                  b->errmCl = 1 << i;
+                  b->errmCl = MASK_BIT(i);
                   b->errmSy = 0;
                   b->state = impossible; /* There's no solution */
                   return 0;              /* Stop solving */
@@ -472,29 +487,30 @@ static INLINE int ProcessDirtyGroup (t_board * b)
           }             /* with groups */
         }
                                    /* Next subset: */
-        if (o==N || j>N || k==n-1) /* If there are already N */
-        {                          /* cells, or they might have */
-          m &= ~ (1<<k);           /* more than N symbols, or the */
-          o --;                    /* last added is the last we */
-                                   /* have... remove it */
-          if (k==n-1)
-          {                        /* If there are not more... */
+        if (o==N || j>N ||         /* If there are already N */
+            o+n-1-k<N)             /* cells, or they might have */
+        {                          /* more than N symbols, or the */
+          m &= ~ MASK_BIT(k);      /* cells left can't make N */
+          o --;                    /* anymore... remove the last */
+                                   /* added */
+          if (o+n-1-k<N)           /* If no cell after it can */
+          {                        /* make N either... */
             if (!o)
               break;               /* Empty hands... end */
 
-            do k--; while (!(m & (1<<k))); /* Go back to the */
+            do k--; while (!(m & MASK_BIT(k))); /* Go back to the */
                                            /* previous cell */
-            m &= ~ (1<<k);                 /* and remove it */
+            m &= ~ MASK_BIT(k);            /* and remove it */
             o --;
           }
         }
                       /* Move left and add the next cell */
         k ++;
-        m |= 1 << k;  /* Don't wait to have N cells: go up */
+        m |= MASK_BIT(k); /* Don't wait to have N cells: go up */
         o ++;         /* and count the symbols... (it saves time) */
 
-        if (!(m & ((1<<p)-1)) ||     /* If there's no hope to have */
-            !(m & ((1<<(n-N+1))-1))) /* a subset of N cells with */
+        if (!(m & MASK_ALL(p)) ||    /* If there's no hope to have */
+            !(m & MASK_ALL(n-N+1)))  /* a subset of N cells with */
           break;                     /* at least one dirty cell, */
       }                              /* stop */
     }
@@ -529,22 +545,22 @@ static INLINE int ProcessDirtyGroup (t_board * b)
                 Ig->pmPC[sy]   )        /* marked possible... */
             {
               for (k=mc=0; k<b->nSy; k++)         /* For those */
-                if ( (Ig->pmPC[sy] & (1<<k)) &&   /* cells not */
-                    !(Ig->pmICl[j] & (1<<k))   )  /* involved... */
+                if ( (Ig->pmPC[sy] & MASK_BIT(k)) && /* cells not */
+                    !(Ig->pmICl[j] & MASK_BIT(k))   ) /* involved... */
                 {
                   c = Ig->ppCl[k];
 
-                  if (c->mPV & (1<<sy))   /* If the cell has that */
+                  if (c->mPV & MASK_BIT(sy)) /* If the cell has that */
                   {                       /* symbol as possible.. */
 
-                    RemovePossibleValuesFromCell (b, c, 1<<sy);
+                    RemovePossibleValuesFromCell (b, c, MASK_BIT(sy));
 
-                    mc = 1 << k;
+                    mc = MASK_BIT(k);
 
                     if (c->nPV==0)         /* No possible symbol */
                     {
                       b->errGr = Ig - b->pGr;
-                      b->errmCl = 1 << k;
+                      b->errmCl = MASK_BIT(k);
                       b->errmSy = 0;
                       b->state = impossible; /* There's no sol. */
                       return 0;              /* Stop solving */
@@ -569,7 +585,7 @@ static INLINE int ProcessDirtyGroup (t_board * b)
               }
                                         /* Store rule information */
               b->ruleIGr = Ig - b->pGr; /* for the user: masks */
-              b->rulemSy = 1 << sy;     /* and intersected group */
+              b->rulemSy = MASK_BIT(sy); /* and intersected group */
               b->rulemCl = mc;          /* (mc refers to it) */
 
               return 1;   /* Go out (there are dirty cells now..) */
@@ -603,24 +619,19 @@ static INLINE int ProcessDirtyGroup (t_board * b)
 
 static INLINE void RemovePossibleValuesFromCell (t_board * b,
                                                  t_cell * c,
-                                                 int m)
+                                                 t_mask m)
 {
-  int i, n, sy;
+  if (b->nGss && (m & c->mPV))   /* After guessing, save the old */
+    PushTrail (b, c - b->pCl, -1, /* values to undo this change */
+               c->mPV, c->nPV);
 
   c->mRPV |= m & c->mPV;         /* Backup ones to be removed */
   c->mPV &= ~m;                  /* and then remove them */
 
-  for (i=n=0, sy=-1; i<b->nSy; i++)
-    if (c->mPV & (1<<i))
-    {
-      n ++;        /* Count remaining possible values */
-      sy = i;      /* and remember one of them */
-    }
-
-  c->nPV = n;
+  c->nPV = MASK_COUNT(c->mPV);    /* Count remaining possible values */
 
-  if (n==1)        /* If only one symbol is possible now, */
-    c->FV = sy;    /* save it */
+  if (c->nPV==1)                  /* If only one symbol is possible */
+    c->FV = MASK_LOWEST(c->mPV);  /* now, save it */
 
   if ( ! (c->flags & DIRTY_FLAG)) /* If the cell */
   {                               /* is clean, */
@@ -634,6 +645,43 @@ static INLINE void RemovePossibleValuesFromCell (t_board * b,
   }
 }
 
+static INLINE void PushTrail (t_board * b,
+                              int idx,  /* Cell or group */
+                              int sy,   /* -1 == cell */
+                              t_mask m, /* Old mask */
+                              int n)    /* Old number of bits */
+{
+  t_trail * t;
+
+  t = b->pTrl + b->nTrl;   /* Room was reserved before the */
+                           /* guess (see ReserveTrail()) */
+  t->idx = idx;
+  t->sy = sy;
+  t->m = m;
+  t->n = n;
+
+  b->nTrl ++;
+}
+
+static INLINE int ReserveTrail (t_board * b)
+{
+  int i, j, n;
+  t_cell * c;
+  t_group * g;
+                   /* Every change removes at least one possible */
+                   /* value or cell, so until the next guess there */
+  n = b->nTrl;     /* can't be more changes than bits left in the */
+                   /* masks of cells and groups */
+  for (i=0, c=b->pCl; i<b->nCl; i++, c++)
+    n += c->nPV;
+
+  for (i=0, g=b->pGr; i<b->nGr; i++, g++)
+    for (j=0; j<b->nSy; j++)
+      n += g->pnPC[j];
+
+  return GrowTrail (b, n);         /* Make room for all of them */
+}
+
 static INLINE void SearchCandidateCellForGuessing (t_board * b)
 {
   char min;
@@ -664,16 +712,18 @@ static INLINE void TakeNextUnexploredGuess (t_board * b)
   int i;
   t_cell * c;
 
-  for (i=0; i<b->nSy; i++)              /* Search for the next */
-    if (b->pmPGss[b->nGss-1] & (1<<i))  /* value to guess */
-      break;
-                                        /* Remove it from the */
-  b->pmPGss[b->nGss-1] &= ~ (1<<i);     /* pending values mask */
+  i = MASK_LOWEST(b->pmPGss[b->nGss-1]);    /* Take the next */
+                                            /* value to guess */
+                                            /* Remove it from the */
+  b->pmPGss[b->nGss-1] &= ~ MASK_BIT(i);    /* pending values mask */
 
+  b->pnTrlGss[b->nGss-1] = b->nTrl;     /* Remember where the */
+                                        /* guess starts in the */
+                                        /* trail */
   c = b->pCl + b->pnGssCl[b->nGss-1];   /* Take the cell, and */
                                          /* guess the chosen */
   RemovePossibleValuesFromCell (b, c,     /* value (remove the */
-                                ~(1<<i));  /* rest of values) */
+                                ~MASK_BIT(i)); /* rest of values) */
 
   b->nGssTotal ++;
 }
@@ -694,45 +744,62 @@ static INLINE void RewindGuess (t_board * b)
 
 static INLINE void RecoverPrevStateForGuessing (t_board * b)
 {
-  int i, n, mv;
-  t_cell * c, * gc;
+  int i;
+  t_trail * t;
+  t_cell * c;
   t_group * g;
-
-  n = b->nSy;           /* Number of symbols */
-  mv = ~ (~0UL << n);   /* Mask with all of them */
-
-  gc = b->pCl + b->pnGssCl[b->nGss-1];  /* Current guessed cell */
+  t_lnode * node;
 
   b->state = unsolved;  /* Restore state */
 
-  for (c=b->pCl; c<b->pCl+b->nCl; c++)  /* For every cell */
-  {
-    c->mPV = mv;                    /* First, add all symbols */
-    c->nPV = n;                     /* as possible values */
-    c->mRPV = 0;
-
-    if (c!=gc &&                /* For all the cells guessed */
-        (c->flags &             /* or solved _before_ current */
-         SOLVED_FLAG) &&        /* guess, set their original */
-        ((c->flags &            /* value, marking them dirty */
-          GUESSED_FLAG) ||      
-         c->nGss<b->nGss))    
+  while (b->nTrl>b->pnTrlGss[b->nGss-1])  /* Undo every change made */
+  {                                       /* since the current guess */
+    b->nTrl --;                           /* was taken (last first) */
+    t = b->pTrl + b->nTrl;
 
-      RemovePossibleValuesFromCell (b, c, ~(1<<c->FV));
-
-    else if (c->flags & SOLVED_FLAG)
+    if (t->sy<0)
     {
-      c->flags &= ~ SOLVED_FLAG;
-      b->nSol --;
+      c = b->pCl + t->idx;      /* Restore the possible values */
+      c->mPV = t->m;            /* of the cell */
+      c->nPV = t->n;
+
+      if (c->nPV>1 &&                 /* If the cell was solved */
+          (c->flags & SOLVED_FLAG))   /* after the guess, it is */
+      {                               /* not anymore */
+        c->flags &= ~ SOLVED_FLAG;
+        b->nSol --;
+      }
+    }
+    else
+    {
+      g = b->pGr + t->idx;      /* Restore the possible cells */
+      g->pmPC[t->sy] = t->m;    /* of the symbol in the group */
+      g->pnPC[t->sy] = t->n;
     }
   }
+                                        /* Guesses are taken when */
+  while (ListGetNum(&b->DirtyCL))       /* nothing is dirty, so */
+  {                                     /* mark everything clean */
+    node = ListGetFirst (&b->DirtyCL);  /* again */
+    c = GET_ELEM (t_cell, node, lnode);
+
+    ListExtract (&b->DirtyCL, &c->lnode);
+    ListAppend (&b->CleanCL, &c->lnode);
 
-  for (g=b->pGr; g<b->pGr+b->nGr; g++)  /* For every group */
-    for (i=0; i<n; i++)                 /* and every value */
+    c->flags &= ~ DIRTY_FLAG;
+    c->mRPV = 0;
+  }
+
+  for (i=0; i<b->maxLevel; i++)
+    while (ListGetNum(b->pDirtyGL+i))
     {
-      g->pmPC[i] = mv;    /* Mark all the cells of the group */
-      g->pnPC[i] = n;     /* as possible */
+      node = ListGetFirst (b->pDirtyGL+i);
+      g = GET_ELEM (t_group, node, lnode);
+
+      ListExtract (b->pDirtyGL+i, &g->lnode);
+      ListAppend (&b->CleanGL, &g->lnode);
 
+      g->flags &= ~ DIRTY_FLAG;
       g->mDirtyCl = 0;
       g->mDirtySy = 0;
     }
@@ -8,38 +8,174 @@
 #include "wrap.h"
 
 #include <ctime>
+#include <cstring>
 #include <algorithm>
 #include <iterator>
+#include <map>
 #include <stdexcept>
+#include <utility>
 
 #include <boost/bind.hpp>
+#include <boost/cstdint.hpp>
+#include <boost/exception_ptr.hpp>
 #include <boost/iterator/counting_iterator.hpp>
+#include <boost/noncopyable.hpp>
 #include <boost/random/mersenne_twister.hpp>
-#include <boost/random/uniform_int.hpp>
+#include <boost/random/seed_seq.hpp>
 #include <boost/ref.hpp>
 #include <boost/scoped_array.hpp>
 #include <boost/shared_ptr.hpp>
+#include <boost/thread/locks.hpp>
+#include <boost/thread/mutex.hpp>
+#include <boost/thread/thread.hpp>
+
+#include <unistd.h>
 
 #include <sudoku-pub.h>
+#include <sudoku-bits.h>
 
 namespace {
 
-class BoardGenerator {
+/*
+ * Get the statistics of the solving done on b since it was last cleaned.
+ */
+SolveStats get_solve_stats(t_board_p b) {
+	SolveStats stats;
+	stats.rules_n1 = GetNumRulesN1(b);
+	stats.rules_n2 = GetNumRulesN2(b);
+	stats.rules_ngt2 = GetNumRulesNGt2(b);
+	stats.guesses = GetTotalGuessings(b);
+	return stats;
+}
+
+/*
+ * A process-wide cache of constructed boards, by shape.
+ * Constructing a board builds all of its topology (groups, intersections and
+ * cross references), which costs more than solving a problem on it. The
+ * solving state is reset by CleanBoard, so a board given back to the cache
+ * can be used for any other problem of the same shape.
+ */
+class BoardCache {
 public:
-	BoardGenerator(size_t block_width, size_t block_height);
-	~BoardGenerator();
+	t_board_p acquire(size_t block_width, size_t block_height);
+	void release(size_t block_width, size_t block_height, t_board_p board);
+
+private:
+	typedef std::pair<size_t, size_t> Shape;
+	typedef std::map<Shape, std::vector<t_board_p> > Boards;
 
-	Board generate(size_t);
+	boost::mutex  m_mutex;
+	Boards        m_boards;
+};
+
+/*
+ * Take a board of the given shape from the cache, or construct one.
+ * Throws std::invalid_argument for invalid shapes.
+ */
+t_board_p BoardCache::acquire(size_t block_width, size_t block_height) {
+	if (block_width < 1 || block_width > MAX_SYMBOLS ||
+			block_height < 1 || block_height > MAX_SYMBOLS ||
+			block_width * block_height < 4 ||
+			block_width * block_height > MAX_SYMBOLS) {
+		throw std::invalid_argument("Invalid board dimensions");
+	}
+	{
+		boost::lock_guard<boost::mutex> lock(m_mutex);
+		Boards::iterator it = m_boards.find(Shape(block_width, block_height));
+		if (it != m_boards.end() && !it->second.empty()) {
+			t_board_p board = it->second.back();
+			it->second.pop_back();
+			CleanBoard(board);
+			return board;
+		}
+	}
+	t_board_p board = ConstructCustomBoard(block_width, block_height, FALSE,
+			0, NULL, NULL);
+	if (board == NULL) {
+		throw std::bad_alloc();
+	}
+	return board;
+}
+
+/*
+ * Give a board back to the cache. One board per hardware thread is kept for
+ * every shape, which is enough for all the workers of
+ * create_boards_parallel(); the others are destroyed.
+ */
+void BoardCache::release(size_t block_width, size_t block_height,
+		t_board_p board) {
+	if (board == NULL) {
+		return;
+	}
+	{
+		boost::lock_guard<boost::mutex> lock(m_mutex);
+		std::vector<t_board_p>& boards = m_boards[Shape(block_width, block_height)];
+		if (boards.size() < std::max(boost::thread::hardware_concurrency(), 1u)) {
+			boards.push_back(board);
+			return;
+		}
+	}
+	DestroyBoard(board);
+}
+
+/*
+ * The cache is never destroyed, since worker threads may still be using it
+ * while the process exits.
+ */
+BoardCache& get_board_cache() {
+	static BoardCache* cache = new BoardCache();
+	return *cache;
+}
+
+/*
+ * A board taken from the cache for the lifetime of the object, so it is given
+ * back even when the construction of its owner fails later on.
+ */
+class CachedBoard : private boost::noncopyable {
+public:
+	CachedBoard(size_t block_width, size_t block_height);
+	~CachedBoard();
+
+	t_board_p get() const;
 
 private:
-	static const size_t          MAX_TRIALS = 16;
+	size_t     m_block_width;
+	size_t     m_block_height;
+	t_board_p  m_board;
+};
+
+CachedBoard::CachedBoard(size_t block_width, size_t block_height):
+		m_block_width(block_width),
+		m_block_height(block_height),
+		m_board(get_board_cache().acquire(block_width, block_height)) {
+	// Nothing here
+}
+
+CachedBoard::~CachedBoard() {
+	get_board_cache().release(m_block_width, m_block_height, m_board);
+}
+
+t_board_p CachedBoard::get() const {
+	return m_board;
+}
 
-	t_board_p                    m_board;
+class BoardGenerator {
+public:
+	BoardGenerator(size_t block_width, size_t block_height,
+			unsigned long long seed);
+
+	Board generate(size_t index);
+
+private:
+	CachedBoard                  m_board;
+	boost::shared_ptr<s_snapshot> m_snapshot;
 	int                          m_num_cells;
 	int                          m_num_symbols;
 	boost::scoped_array<size_t>  m_cells;
 	boost::scoped_array<size_t>  m_symbols;
 	boost::scoped_array<char>    m_given;
+	boost::scoped_array<char>    m_solution;
+	unsigned long long           m_seed;
 	boost::mt19937               m_random_generator;
 
 	size_t                       m_block_width;
@@ -49,87 +185,112 @@ private:
 	size_t rnd(size_t min, size_t max);
 };
 
-BoardGenerator::BoardGenerator(size_t block_width, size_t block_height):
-		m_board(ConstructCustomBoard(block_width, block_height,
-				FALSE, 0 ,NULL, NULL)),
-		m_num_cells(m_board != NULL ? GetNumCells(m_board) : 0),
-		m_num_symbols(m_board != NULL ? GetNumSymbols(m_board) : 0),
+BoardGenerator::BoardGenerator(size_t block_width, size_t block_height,
+		unsigned long long seed):
+		m_board(block_width, block_height),
+		m_snapshot(AllocateSnapshot(m_board.get()), DestroySnapshot),
+		m_num_cells(GetNumCells(m_board.get())),
+		m_num_symbols(GetNumSymbols(m_board.get())),
 		m_cells(new size_t[m_num_cells]),
 		m_symbols(new size_t[m_num_cells]),
-		m_given(new char[m_num_cells]),
-		m_random_generator(std::time(NULL)),
+		m_given(new char[m_num_cells + 1]),
+		m_solution(new char[m_num_cells]),
+		m_seed(seed),
 		m_block_width(block_width),
 		m_block_height(block_height) {
-	if (m_board == NULL) {
+	if (!m_snapshot) {
 		throw std::bad_alloc();
 	}
 }
 
-BoardGenerator::~BoardGenerator() {
-	if (m_board != NULL) {
-		DestroyBoard(m_board);
-	}
-}
+/*
+ * Generate the board with the given index in the sequence of the seed.
+ * Every board gets its own random sequence, so it depends only on the seed
+ * and its index, and not on the boards generated before it.
+ */
+Board BoardGenerator::generate(size_t index) {
+	size_t n;
+
+	boost::uint64_t seed = m_seed;
+	boost::uint64_t wide_index = index;
+	boost::uint32_t words[] = {
+		static_cast<boost::uint32_t>(seed),
+		static_cast<boost::uint32_t>(seed >> 32),
+		static_cast<boost::uint32_t>(wide_index),
+		static_cast<boost::uint32_t>(wide_index >> 32)
+	};
+	boost::random::seed_seq seed_seq(words, words + 4);
+	m_random_generator.seed(seed_seq);
+
+	// Start with a few random assignments, and find a solution for them by
+	// guessing. Assigning random symbols until the board is solved does not
+	// work for big boards, where the assignments stop having any solution
+	// long before the rules can tell.
+	do {
+		CleanBoard(m_board.get());
+		for (n = 0; n < m_num_symbols && GetState(m_board.get()) == unsolved; ++n) {
+			size_t cell;
+			do {
+				cell = rnd(m_num_cells);
+			} while (GetNumPossValuesOfCell(m_board.get(), cell) == 1);
+
+			t_mask values = GetPossValuesOfCell(m_board.get(), cell);
+			for (size_t skip = rnd(GetNumPossValuesOfCell(m_board.get(), cell)); skip > 0; --skip) {
+				values = MASK_NEXT(values);
+			}
+			size_t symbol = MASK_LOWEST(values);
+			SetSymbolInCell(m_board.get(), symbol, cell);
+			Solve(m_board.get(), 0, FALSE);
 
-Board BoardGenerator::generate(size_t) {
-	CleanBoard(m_board);
+			m_symbols[n] = symbol;
+			m_cells[n] = cell;
+		}
+
+		if (!SaveSnapshot(m_board.get(), m_snapshot.get())) {
+			throw std::bad_alloc();
+		}
+		if (Solve(m_board.get(), 0, TRUE) < 0) {
+			throw std::bad_alloc();
+		}
+	} while (GetState(m_board.get()) != solved);
 
-	size_t n = 0;
-	size_t trials = 0;
-	e_state state;
+	for (int i = 0; i < m_num_cells; ++i) {
+		m_solution[i] = GetSymbolOfCell(m_board.get(), i);
+	}
+	RestoreSnapshot(m_board.get(), m_snapshot.get());
 
-	// This loop generates a solved board
-	do {
+	// Then assign symbols of that solution to random cells, until the rules
+	// alone solve the board
+	while (GetState(m_board.get()) != solved) {
 		size_t cell;
 		do {
 			cell = rnd(m_num_cells);
-		} while (GetNumPossValuesOfCell(m_board, cell) == 1);
-
-		size_t symbol = rnd(GetNumPossValuesOfCell(m_board, cell));
-		for (size_t i = 0, j = 0; i < m_num_symbols; ++i) {
-			if (GetPossValuesOfCell(m_board, cell) & (1ul << i)) {
-				if (j == symbol) {
-					symbol = i;
-					break;
-				} else {
-					++j;
-				}
-			}
-		}
-		SetSymbolInCell(m_board, symbol, cell);
-
-		Solve(m_board, 0, FALSE);
-		state = GetState(m_board);
-
-		if (state == impossible) {
-			CleanBoard(m_board);
-			if (trials < MAX_TRIALS) {
-				for (size_t i = 0; i < n; ++i) {
-					SetSymbolInCell(m_board, m_symbols[i], m_cells[i]);
-				}
-				++trials;
-			} else {
-				n = trials = 0;
-			}
-			continue;
-		}
+		} while (GetNumPossValuesOfCell(m_board.get(), cell) == 1);
+
+		SetSymbolInCell(m_board.get(), m_solution[cell], cell);
+		Solve(m_board.get(), 0, FALSE);
 
-		m_symbols[n] = symbol;
+		m_symbols[n] = m_solution[cell];
 		m_cells[n] = cell;
 		++n;
-	} while(state != solved);
+	}
 
-	// Remove unneeded assignments
+	// Remove unneeded assignments.
+	// Here m_snapshot holds the board with the first j assignments (all of
+	// them needed) solved, so each check only replays the ones after j.
+	CleanBoard(m_board.get());
+	if (!SaveSnapshot(m_board.get(), m_snapshot.get())) {
+		throw std::bad_alloc();
+	}
 	size_t j = 0;
 	while (j < n) {
-		CleanBoard(m_board);
-		for (size_t i = 0; i < n; ++i) {
-			if (i != j) {
-				SetSymbolInCell(m_board, m_symbols[i], m_cells[i]);
-			}
+		for (size_t i = j + 1; i < n; ++i) {
+			SetSymbolInCell(m_board.get(), m_symbols[i], m_cells[i]);
 		}
-		Solve(m_board, 0, FALSE);
-		if (GetState(m_board) == solved) {
+		Solve(m_board.get(), 0, FALSE);
+		bool unneeded = GetState(m_board.get()) == solved;
+		RestoreSnapshot(m_board.get(), m_snapshot.get());
+		if (unneeded) {
 			--n;
 			// TODO s = 1; ?
 			for (size_t i = j; i < n; ++i) {
@@ -137,17 +298,22 @@ Board BoardGenerator::generate(size_t) {
 				m_cells[i] = m_cells[i+1];
 			}
 		} else {
+			SetSymbolInCell(m_board.get(), m_symbols[j], m_cells[j]);
+			Solve(m_board.get(), 0, FALSE);
+			if (!SaveSnapshot(m_board.get(), m_snapshot.get())) {
+				throw std::bad_alloc();
+			}
 			++j;
 		}
 	}
 
 	// Do something wiered (TODO)
-	CleanBoard(m_board);
+	CleanBoard(m_board.get());
 	for (size_t i = 0; i < n; ++i) {
-		SetSymbolInCell(m_board, m_symbols[i], m_cells[i]);
+		SetSymbolInCell(m_board.get(), m_symbols[i], m_cells[i]);
 	}
-	Solve(m_board, 0, FALSE);
-	if (!GetNumRulesNGt1(m_board)) {
+	Solve(m_board.get(), 0, FALSE);
+	if (!GetNumRulesNGt1(m_board.get())) {
 		size_t k = rnd(m_num_cells / 5, m_num_cells / 2);
 		std::fill(m_given.get(), m_given.get() + m_num_cells, 0);
 		for (size_t i = 0; i < n; ++i) {
@@ -160,7 +326,7 @@ Board BoardGenerator::generate(size_t) {
 				do {
 					cell = rnd(m_num_cells);
 				} while (m_given[cell]);
-				m_symbols[n] = GetSymbolOfCell(m_board, cell);
+				m_symbols[n] = GetSymbolOfCell(m_board.get(), cell);
 				m_cells[n] = cell;
 				m_given[n] = 1;
 				// ++n;
@@ -169,32 +335,158 @@ Board BoardGenerator::generate(size_t) {
 	}
 
 	// Fill the board and get the problem
-	CleanBoard(m_board);
+	CleanBoard(m_board.get());
 	for (size_t i = 0; i < n; ++i) {
-		SetSymbolInCell(m_board, m_symbols[i], m_cells[i]);
+		SetSymbolInCell(m_board.get(), m_symbols[i], m_cells[i]);
 	}
-	GetBoardRaw(m_board, m_given.get(), NULL, " X");
+	GetBoardRaw(m_board.get(), m_given.get(), NULL, " X");
 	std::string problem(m_given.get(), m_num_cells);
 
 	// Solve the board and get the solution
-	Solve(m_board, 0, FALSE);
-	GetBoardRaw(m_board, m_given.get(), NULL, " X");
+	Solve(m_board.get(), 0, FALSE);
+	GetBoardRaw(m_board.get(), m_given.get(), NULL, " X");
 	std::string solution(m_given.get(), m_num_cells);
 
-	return Board(problem, solution, m_block_width, m_block_height);
+	return Board(problem, solution, m_block_width, m_block_height,
+			get_solve_stats(m_board.get()));
 }
 
 size_t BoardGenerator::rnd(size_t max) {
 	return rnd(0, max);
 }
 
+/*
+ * A random number in [min, max). The raw 32 bit draws of mt19937 are mapped
+ * to the range here, by rejecting the draws past the last whole multiple of
+ * its size, so the numbers do not depend on the width of size_t or on the
+ * distributions of the boost version. Ranges are at most MAX_SYMBOLS *
+ * MAX_SYMBOLS wide, far below 2^32.
+ */
 size_t BoardGenerator::rnd(size_t min, size_t max) {
-	boost::uniform_int<size_t> dist(min, max - 1);
-	return dist(m_random_generator);
+	const boost::uint64_t num_draws = boost::uint64_t(1) << 32;
+	boost::uint64_t range = max - min;
+	boost::uint64_t limit = num_draws - num_draws % range;
+	boost::uint64_t draw;
+	do {
+		draw = static_cast<boost::uint32_t>(m_random_generator());
+	} while (draw >= limit);
+	return min + static_cast<size_t>(draw % range);
+}
+
+class BoardSolver {
+public:
+	BoardSolver(size_t block_width, size_t block_height);
+
+	void load(const std::string& problem);
+	size_t count_solutions(size_t limit);
+	Board solve(const std::string& problem, bool guess);
+
+private:
+	CachedBoard                  m_board;
+	size_t                       m_num_cells;
+	const char*                  m_symbols;
+	boost::scoped_array<char>    m_raw;
+	size_t                       m_block_width;
+	size_t                       m_block_height;
+};
+
+BoardSolver::BoardSolver(size_t block_width, size_t block_height):
+		m_board(block_width, block_height),
+		m_num_cells(GetNumCells(m_board.get())),
+		m_symbols(GetDefaultSymbols(GetNumSymbols(m_board.get()))),
+		m_raw(new char[m_num_cells + 1]),
+		m_block_width(block_width),
+		m_block_height(block_height) {
+	// Nothing here
+}
+
+/*
+ * Set the given problem in the board, without checking it (contradicting
+ * givens are found when solving). Empty cells may be ' ', '.' or '0' (the
+ * latter only when '0' is not a symbol).
+ */
+void BoardSolver::load(const std::string& problem) {
+	if (problem.size() != m_num_cells) {
+		throw std::invalid_argument("Wrong problem length");
+	}
+
+	CleanBoard(m_board.get());
+	for (size_t i = 0; i < m_num_cells; ++i) {
+		char c = problem[i];
+		const char* symbol = c != '\0' ? std::strchr(m_symbols, c) : NULL;
+		if (symbol != NULL) {
+			RemovePossValuesFromCell(m_board.get(), ~MASK_BIT(symbol - m_symbols), i);
+		} else if (c != ' ' && c != '.' && c != '0') {
+			throw std::invalid_argument("Invalid symbol in problem");
+		}
+	}
+}
+
+size_t BoardSolver::count_solutions(size_t limit) {
+	// The rules of the solver only remove values that can not be part of any
+	// solution, so apply them first to keep the search small
+	Solve(m_board.get(), 0, FALSE);
+	int res = CountSolutions(m_board.get(), limit);
+	if (res < 0) {
+		throw std::bad_alloc();
+	}
+	return res;
+}
+
+/*
+ * Solve the given problem. Cells that could not be solved (because guessing
+ * is not allowed, or the problem has no solution) are left empty.
+ */
+Board BoardSolver::solve(const std::string& problem, bool guess) {
+	load(problem);
+	if (Solve(m_board.get(), 0, guess ? TRUE : FALSE) < 0) {
+		throw std::bad_alloc();
+	}
+	GetBoardRaw(m_board.get(), m_raw.get(), NULL, "  ");
+	return Board(problem, std::string(m_raw.get(), m_num_cells),
+			m_block_width, m_block_height, get_solve_stats(m_board.get()));
+}
+
+/*
+ * Generate every num_workers-th board, starting at first_index.
+ * Each worker writes only its own slots, and every board depends only on its
+ * index, so the result does not depend on thread scheduling.
+ * An exception escaping a thread would terminate the process, so a failure is
+ * kept in error instead, for the caller to throw again.
+ */
+void generate_boards(BoardGenerator& generator, std::vector<Board>& boards,
+		size_t first_index, size_t num_workers, boost::exception_ptr& error) {
+	try {
+		for (size_t i = first_index; i < boards.size(); i += num_workers) {
+			boards[i] = generator.generate(i);
+		}
+	} catch (...) {
+		error = boost::current_exception();
+	}
 }
 
 }  // anonymous namespace
 
+SolveStats::SolveStats():
+		rules_n1(0),
+		rules_n2(0),
+		rules_ngt2(0),
+		guesses(0) {
+	// Nothing here
+}
+
+Difficulty SolveStats::get_difficulty() const {
+	if (guesses) {
+		return DIFFICULTY_FIENDISH;
+	} else if (rules_ngt2) {
+		return DIFFICULTY_HARD;
+	} else if (rules_n2) {
+		return DIFFICULTY_MEDIUM;
+	} else {
+		return DIFFICULTY_EASY;
+	}
+}
+
 Board::Board(const std::string& solution, size_t block_width, size_t block_height):
 		m_problem(solution),
 		m_solution(solution),
@@ -204,11 +496,12 @@ Board::Board(const std::string& solution, size_t block_width, size_t block_heigh
 }
 
 Board::Board(const std::string& problem, const std::string& solution,
-		size_t block_width, size_t block_heght):
+		size_t block_width, size_t block_heght, const SolveStats& stats):
 		m_problem(problem),
 		m_solution(solution),
 		m_block_width(block_width),
-		m_block_height(block_heght) {
+		m_block_height(block_heght),
+		m_stats(stats) {
 	// Nothing here
 }
 
@@ -244,14 +537,51 @@ char Board::get_solution(size_t x, size_t y) const {
 	return m_solution[calc_index(x, y)];
 }
 
+bool Board::is_solved() const {
+	return !m_solution.empty() && m_solution.find(' ') == std::string::npos;
+}
+
+const SolveStats& Board::get_stats() const {
+	return m_stats;
+}
+
+Difficulty Board::get_difficulty() const {
+	return m_stats.get_difficulty();
+}
+
 size_t Board::calc_index(size_t x, size_t y) const {
 	size_t line_width = m_block_width * m_block_height;
 	return x + y * line_width;
 }
 
+unsigned long long random_seed() {
+	static boost::mutex mutex;
+	static boost::uint32_t counter = 0;
+
+	boost::uint32_t words[] = {
+		static_cast<boost::uint32_t>(std::time(NULL)),
+		static_cast<boost::uint32_t>(std::clock()),
+		static_cast<boost::uint32_t>(getpid()),
+		0
+	};
+	{
+		boost::lock_guard<boost::mutex> lock(mutex);
+		words[3] = counter++;
+	}
+	boost::random::seed_seq seed_seq(words, words + 4);
+	boost::uint32_t seed[2];
+	seed_seq.generate(seed, seed + 2);
+	return (static_cast<unsigned long long>(seed[1]) << 32) | seed[0];
+}
+
 std::vector<Board> create_board(size_t block_width, size_t block_height,
 		size_t num_boards) {
-	BoardGenerator generator(block_width, block_height);
+	return create_board(block_width, block_height, num_boards, random_seed());
+}
+
+std::vector<Board> create_board(size_t block_width, size_t block_height,
+		size_t num_boards, unsigned long long seed) {
+	BoardGenerator generator(block_width, block_height, seed);
 	std::vector<Board> res;
 	res.reserve(num_boards);
 	std::transform(boost::counting_iterator<size_t>(0),
@@ -264,3 +594,139 @@ std::vector<Board> create_board(size_t block_width, size_t block_height,
 Board create_board(size_t block_width, size_t block_height) {
 	return create_board(block_width, block_height, 1)[0];
 }
+
+Board generate_board(size_t block_width, size_t block_height,
+		unsigned long long seed, size_t index) {
+	BoardGenerator generator(block_width, block_height, seed);
+	return generator.generate(index);
+}
+
+std::vector<Board> create_boards_parallel(size_t block_width,
+		size_t block_height, size_t num_boards, size_t num_threads) {
+	return create_boards_parallel(block_width, block_height, num_boards,
+			num_threads, random_seed());
+}
+
+std::vector<Board> create_boards_parallel(size_t block_width,
+		size_t block_height, size_t num_boards, size_t num_threads,
+		unsigned long long seed) {
+	if (num_threads == 0) {
+		num_threads = std::max(boost::thread::hardware_concurrency(), 1u);
+	}
+	num_threads = std::min(num_threads, std::max(num_boards, size_t(1)));
+
+	// Construct the generators here, so a failure to construct them is thrown
+	// before any worker is started. Failures inside the workers are thrown
+	// once they are all done.
+	std::vector<boost::shared_ptr<BoardGenerator> > generators;
+	generators.reserve(num_threads);
+	for (size_t i = 0; i < num_threads; ++i) {
+		generators.push_back(boost::shared_ptr<BoardGenerator>(
+				new BoardGenerator(block_width, block_height, seed)));
+	}
+
+	std::vector<Board> res(num_boards,
+			Board(std::string(), block_width, block_height));
+	std::vector<boost::exception_ptr> errors(num_threads);
+	boost::thread_group workers;
+	try {
+		for (size_t i = 0; i < num_threads; ++i) {
+			workers.create_thread(boost::bind(&generate_boards,
+					boost::ref(*generators[i]), boost::ref(res), i, num_threads,
+					boost::ref(errors[i])));
+		}
+	} catch (...) {
+		// The workers already started still use res and errors
+		workers.join_all();
+		throw;
+	}
+	workers.join_all();
+	for (size_t i = 0; i < num_threads; ++i) {
+		if (errors[i]) {
+			boost::rethrow_exception(errors[i]);
+		}
+	}
+	return res;
+}
+
+struct BoardStream::State {
+	State(size_t block_width, size_t block_height, unsigned long long seed,
+			size_t shard, size_t num_shards):
+			generator(block_width, block_height, seed),
+			seed(seed),
+			shard(shard),
+			num_shards(num_shards),
+			num_generated(0) {
+		// Nothing here
+	}
+
+	BoardGenerator      generator;
+	unsigned long long  seed;
+	size_t              shard;
+	size_t              num_shards;
+	size_t              num_generated;
+};
+
+BoardStream::BoardStream(size_t block_width, size_t block_height):
+		m_state(new State(block_width, block_height, random_seed(), 0, 1)) {
+	// Nothing here
+}
+
+BoardStream::BoardStream(size_t block_width, size_t block_height,
+		unsigned long long seed, size_t shard, size_t num_shards):
+		m_state(NULL) {
+	if (num_shards == 0 || shard >= num_shards) {
+		throw std::invalid_argument("Invalid shard");
+	}
+	m_state = new State(block_width, block_height, seed, shard, num_shards);
+}
+
+BoardStream::~BoardStream() {
+	delete m_state;
+}
+
+Board BoardStream::generate() {
+	Board board = m_state->generator.generate(get_next_index());
+	++m_state->num_generated;
+	return board;
+}
+
+size_t BoardStream::get_num_generated() const {
+	return m_state->num_generated;
+}
+
+unsigned long long BoardStream::get_seed() const {
+	return m_state->seed;
+}
+
+size_t BoardStream::get_next_index() const {
+	return m_state->shard + m_state->num_generated * m_state->num_shards;
+}
+
+size_t count_solutions(const Board& board, size_t limit) {
+	BoardSolver solver(board.get_block_width(), board.get_block_height());
+	solver.load(board.get_problem());
+	return solver.count_solutions(limit);
+}
+
+Board solve(const std::string& problem, size_t block_width,
+		size_t block_height, bool guess) {
+	BoardSolver solver(block_width, block_height);
+	return solver.solve(problem, guess);
+}
+
+std::vector<Board> solve_boards(const std::vector<std::string>& problems,
+		size_t block_width, size_t block_height, bool guess) {
+	BoardSolver solver(block_width, block_height);
+	std::vector<Board> res;
+	res.reserve(problems.size());
+	for (size_t i = 0; i < problems.size(); ++i) {
+		res.push_back(solver.solve(problems[i], guess));
+	}
+	return res;
+}
+
+SolveStats rate_board(const Board& board) {
+	BoardSolver solver(board.get_block_width(), board.get_block_height());
+	return solver.solve(board.get_problem(), true).get_stats();
+}
@@ -11,11 +11,39 @@
 #include <string>
 #include <vector>
 
+/*
+ * Difficulty grades, by the hardest technique needed to solve a problem.
+ * Generated problems are solvable by the rules alone, so they are never
+ * rated DIFFICULTY_FIENDISH.
+ */
+enum Difficulty {
+	DIFFICULTY_EASY,     // Only rules about single cells or symbols
+	DIFFICULTY_MEDIUM,   // Rules about pairs of cells or symbols
+	DIFFICULTY_HARD,     // Rules about larger sets of cells or symbols
+	DIFFICULTY_FIENDISH  // Guessing
+};
+
+/*
+ * Statistics of solving a problem: the number of rules applied of every
+ * level, and the number of guesses (failed ones included).
+ */
+struct SolveStats {
+	SolveStats();
+
+	size_t rules_n1;
+	size_t rules_n2;
+	size_t rules_ngt2;
+	size_t guesses;
+
+	Difficulty get_difficulty() const;
+};
+
 class Board {
 public:
 	Board(const std::string& solution, size_t block_width, size_t block_height);
 	Board(const std::string& problem, const std::string& solution,
-			size_t block_width, size_t block_height);
+			size_t block_width, size_t block_height,
+			const SolveStats& stats = SolveStats());
 
 	const std::string& get_problem() const;
 	const std::string& get_solution() const;
@@ -26,6 +54,15 @@ public:
 	char get(size_t x, size_t y, bool solution) const;
 	char get_problem(size_t x, size_t y) const;
 	char get_solution(size_t x, size_t y) const;
+
+	bool is_solved() const;
+
+	/*
+	 * Statistics of solving the problem, for boards that were generated or
+	 * solved (otherwise all zero, see rate_board()).
+	 */
+	const SolveStats& get_stats() const;
+	Difficulty get_difficulty() const;
 private:
 	std::string m_problem;
 	std::string m_solution;
@@ -33,11 +70,107 @@ private:
 	size_t      m_block_width;
 	size_t      m_block_height;
 
+	SolveStats  m_stats;
+
 	size_t calc_index(size_t x, size_t y) const;
 };
 
+/*
+ * A new seed for generating boards, different on every call (even in the
+ * same second, or in other processes).
+ */
+unsigned long long random_seed();
+
+/*
+ * Generated boards are reproducible: every seed defines a sequence of boards,
+ * and the board with a given index in it is always the same. Without a seed,
+ * a random one is used.
+ * The board depends only on the shape, the seed and the index (the low 64
+ * bits of each), and not on the platform, the width of size_t or the number
+ * of threads: the random numbers come from mt19937 seeded through seed_seq,
+ * both fully specified by the C++ standard, and are mapped to ranges here.
+ * The same seed may give other boards in another version of this library,
+ * if the way boards are generated or rated changes.
+ */
 std::vector<Board> create_board(size_t block_width, size_t block_height,
 		size_t num_boards);
+std::vector<Board> create_board(size_t block_width, size_t block_height,
+		size_t num_boards, unsigned long long seed);
 Board create_board(size_t block_width, size_t block_height);
 
+/*
+ * Generate (again) the board with the given index in the sequence of the
+ * seed.
+ */
+Board generate_board(size_t block_width, size_t block_height,
+		unsigned long long seed, size_t index);
+
+/*
+ * Generates new boards one at a time, so any number of boards can be created
+ * without holding them all in memory (see iter_boards() in Python).
+ * A stream generates the boards of shard (0 based) out of num_shards of the
+ * sequence of a seed: the boards with indexes shard, shard + num_shards,
+ * shard + 2 * num_shards and so on. Streams of different shards of the same
+ * seed never generate the same board.
+ */
+class BoardStream {
+public:
+	BoardStream(size_t block_width, size_t block_height);
+	BoardStream(size_t block_width, size_t block_height,
+			unsigned long long seed, size_t shard = 0, size_t num_shards = 1);
+	~BoardStream();
+
+	Board generate();
+	size_t get_num_generated() const;
+
+	unsigned long long get_seed() const;
+	size_t get_next_index() const;
+
+private:
+	struct State;
+
+	State*  m_state;
+
+	BoardStream(const BoardStream&);
+	BoardStream& operator=(const BoardStream&);
+};
+
+/*
+ * Create num_boards boards using num_threads worker threads (0 means one per
+ * hardware thread). The boards are the same as create_board() gives for the
+ * same seed, whatever the number of threads.
+ */
+std::vector<Board> create_boards_parallel(size_t block_width,
+		size_t block_height, size_t num_boards, size_t num_threads = 0);
+std::vector<Board> create_boards_parallel(size_t block_width,
+		size_t block_height, size_t num_boards, size_t num_threads,
+		unsigned long long seed);
+
+/*
+ * Count the solutions of the board's problem, stopping once limit solutions
+ * are found (0 means no limit). With the default limit, 1 means the problem
+ * has a unique solution.
+ */
+size_t count_solutions(const Board& board, size_t limit = 2);
+
+/*
+ * Solve a problem given as a string with one character per cell (empty cells
+ * are ' ', '.' or '0'). Without guessing, only the logical rules are used.
+ * Check the result with Board::is_solved().
+ */
+Board solve(const std::string& problem, size_t block_width,
+		size_t block_height, bool guess = true);
+
+/*
+ * Solve many problems of the same shape, reusing a single board.
+ */
+std::vector<Board> solve_boards(const std::vector<std::string>& problems,
+		size_t block_width, size_t block_height, bool guess = true);
+
+/*
+ * Solve the board's problem (guessing if needed) and return the statistics
+ * of the solution, for boards that do not have them yet.
+ */
+SolveStats rate_board(const Board& board);
+
 #endif /* WRAP_H_ */
@@ -14,15 +14,156 @@ Allows generating standard and custom sudoku board using the Python interpreter.
 
 %{
 #include "wrap.h"
+
+/* Releases the GIL for the lifetime of the object */
+class ScopedGILRelease {
+public:
+	ScopedGILRelease(): m_state(PyEval_SaveThread()) {}
+	~ScopedGILRelease() { PyEval_RestoreThread(m_state); }
+private:
+	PyThreadState* m_state;
+};
+%}
+
+%init %{
+PyEval_InitThreads();
 %}
 
 %feature("autodoc", "1");
 %nodefaultctor Board;
 
+%include "exception.i"
 %include "std_string.i"
 %include "std_vector.i"
+
+/* Release the GIL while a (possibly long) computation runs in C++ */
+%define RELEASE_GIL(function)
+%exception function {
+	try {
+		ScopedGILRelease release;
+		$action
+	} catch (const std::bad_alloc&) {
+		SWIG_exception(SWIG_MemoryError, "Not enough memory");
+	} catch (const std::invalid_argument& e) {
+		SWIG_exception(SWIG_ValueError, e.what());
+	} catch (const std::exception& e) {
+		SWIG_exception(SWIG_RuntimeError, e.what());
+	}
+}
+%enddef
+
+RELEASE_GIL(create_board)
+RELEASE_GIL(create_boards_parallel)
+RELEASE_GIL(generate_board)
+RELEASE_GIL(count_solutions)
+RELEASE_GIL(solve)
+RELEASE_GIL(solve_boards)
+RELEASE_GIL(rate_board)
+RELEASE_GIL(BoardStream::BoardStream)
+RELEASE_GIL(BoardStream::generate)
+
 %include "wrap.h"
 
 %ignore std::vector<Board>::vector(size_type);
 %ignore std::vector<Board>::resize(size_type); 
 %template(BoardVec) std::vector<Board>;
+%template(StringVec) std::vector<std::string>;
+
+%pythoncode %{
+import threading
+
+class BoardFuture(object):
+    """
+    The result of a board generation running in a background thread.
+    """
+
+    def __init__(self, func, *args):
+        """
+        Start running func(*args) in a new daemon thread.
+        """
+        super(BoardFuture, self).__init__()
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._error = None
+
+        thread = threading.Thread(target=self._run, args=(func, args))
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, func, args):
+        try:
+            self._result = func(*args)
+        except Exception as e:
+            self._error = e
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        """
+        Returns True if the generation has finished.
+        """
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the generation to finish and return the created boards.
+        Raises RuntimeError if the timeout expires first, or the exception
+        raised by the generation if it failed.
+        """
+        if not self._event.wait(timeout) and not self._event.is_set():
+            raise RuntimeError("Board generation timed out")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(future) when the generation finishes (immediately if it
+        already has). Callbacks run in the generating thread.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+def create_board_async(block_width, block_height, num_boards=1):
+    """
+    Start creating boards in a background thread and return a BoardFuture.
+    Since the generation releases the GIL, other threads keep running
+    meanwhile. asyncio users may instead await
+    loop.run_in_executor(None, create_board, block_width, block_height, num_boards).
+    """
+    return BoardFuture(create_board, block_width, block_height, num_boards)
+
+def iter_boards(block_width, block_height, count=None, seed=None, shard=0,
+                num_shards=1):
+    """
+    Yield count new boards (or endless boards if count is None), creating
+    each one only when it is needed. Since the boards are not kept, any
+    number of them can be streamed into a DB, a file or a response with
+    constant memory.
+    The boards are those of the given shard of the sequence of the seed (see
+    BoardStream), so num_shards workers given the same seed create disjoint
+    parts of the same sequence, and any board can be created again with
+    generate_board(). Without a seed, a random one is used.
+    """
+    if seed is None:
+        seed = random_seed()
+    stream = BoardStream(block_width, block_height, seed, shard, num_shards)
+    while count is None or stream.get_num_generated() < count:
+        yield stream.generate()
+
+def solve_many(problems, block_width, block_height, guess=True):
+    """
+    Solve every problem in the given iterable and return a list of boards, in
+    the same order. A single board is reused for all of them, and the GIL is
+    released while solving.
+    """
+    return list(solve_boards(list(problems), block_width, block_height, guess))
+%}
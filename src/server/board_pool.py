@@ -0,0 +1,263 @@
+"""
+board_pool.py
+
+ Created on: Oct 18 2026
+"""
+
+import threading
+
+import pysudoku
+
+import db
+
+### CONSTANTS ###
+
+REFILL_BATCH = 5    # Boards generated at once by the refill thread
+IDLE_WAIT = 30      # Seconds between checks of a full pool
+INSERT_BATCH = 20   # Boards created for a user between commits
+MAX_MISSES = 200    # Batches in a row without a board of a difficulty before
+                    # a shape is taken to never reach it
+MAX_PENDING = 100   # Boards a user may have queued at once
+
+### CLASSES ###
+
+class PendingRequest(object):
+    """
+    Boards of a given difficulty that a user asked for, but were not in the
+    pool. The refill thread gives them to the user as they are generated.
+    """
+
+    def __init__(self, uid, width, height, difficulty, count):
+        self.uid = uid
+        self.width = width
+        self.height = height
+        self.difficulty = difficulty
+        self.count = count
+
+class BoardPool(object):
+    """
+    A pool of ready-made boards, kept in the DB as boards of db.POOL_UID.
+    A background thread keeps BOARD_POOL_SIZE boards of every shape in
+    BOARD_POOL_SHAPES and every one of the given difficulties, so creating
+    boards of these shapes is just a DB update.
+    Boards can not be generated with a given difficulty, so requests for a
+    difficulty are never generated while the user waits. What the pool can
+    not give at once is queued (up to MAX_PENDING boards per user), and the
+    refill thread gives it to the user later (before it refills the pool).
+    Queued requests are kept in memory, so they are lost if the server stops,
+    and they are dropped if their shape turns out to never reach their
+    difficulty.
+    """
+
+    def __init__(self, app, difficulties):
+        """
+        Initialize the pool. The refill thread is started by start().
+        """
+        self.app = app
+        self.size = app.config.get("BOARD_POOL_SIZE", 0)
+        self.shapes = set(tuple(shape) for shape
+                          in app.config.get("BOARD_POOL_SHAPES", ()))
+        self.difficulties = list(difficulties)
+        self.pending = []
+        self.misses = {}
+        self.last_shape = (0, 0)
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def is_pooled(self, width, height):
+        return self.size > 0 and (width, height) in self.shapes
+
+    def is_reachable(self, width, height, difficulty):
+        """
+        Return whether boards of the given shape may be of the given
+        difficulty, as far as the boards generated so far tell. Small shapes
+        never get hard boards, for instance.
+        """
+        with self.lock:
+            return self.misses.get((width, height, difficulty), 0) < MAX_MISSES
+
+    def start(self):
+        """
+        Start the refill thread, unless it is already running in this process.
+        """
+        with self.lock:
+            if not self.pending and not (self.size and self.shapes):
+                return
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run,
+                                               name="board-pool")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def take_boards(self, conn, uid, width, height, count, difficulty=None):
+        """
+        Give count new boards of the given shape to a user, and return their
+        IDs and the number of boards queued.
+        Without a difficulty, as many boards as possible are taken from the
+        pool (of any difficulty), and the rest are created and inserted as
+        they are generated, INSERT_BATCH boards per commit.
+        With a difficulty, the boards are only taken from the pool. The
+        missing ones are queued and given to the user by the refill thread,
+        so fewer boards may be returned. Some may be neither returned nor
+        queued, if the user has too many boards queued already, or the shape
+        was found to never reach the difficulty.
+        ValueError is raised for an invalid shape.
+        """
+        board_ids = []
+        if self.is_pooled(width, height):
+            board_ids = db.take_pool_boards(conn, uid, width, height, count,
+                                            difficulty)
+            conn.commit()
+
+        missing = count - len(board_ids)
+        num_queued = 0
+        if missing > 0 and difficulty is not None:
+            # Raises ValueError for an invalid shape now, rather than later
+            # in the refill thread
+            pysudoku.BoardStream(width, height)
+            num_queued = self.queue(uid, width, height, difficulty, missing)
+        elif missing > 0:
+            boards = pysudoku.iter_boards(width, height, missing)
+            board_ids += db.insert_boards(conn, uid, boards, INSERT_BATCH)
+            conn.commit()
+
+        self.start()
+        self.wakeup.set()
+        return board_ids, num_queued
+
+    def queue(self, uid, width, height, difficulty, count):
+        """
+        Queue a request for count boards of the given shape and difficulty,
+        as far as the user may have boards queued, and return the number of
+        boards queued.
+        """
+        if not self.is_reachable(width, height, difficulty):
+            return 0
+        with self.lock:
+            queued = sum(request.count for request in self.pending
+                         if request.uid == uid)
+            count = min(count, MAX_PENDING - queued)
+            if count <= 0:
+                return 0
+            self.pending.append(PendingRequest(uid, width, height,
+                                               difficulty, count))
+            return count
+
+    def choose_shape(self, conn):
+        """
+        Choose the shape to generate boards of: the shape of a queued
+        request (they take turns, so none holds back the others), or else the
+        next pooled shape (in turns too) that misses boards of a difficulty
+        it can reach. Return None if there is nothing to do.
+        """
+        with self.lock:
+            if self.pending:
+                request = self.pending.pop(0)
+                self.pending.append(request)
+                return request.width, request.height
+        if not self.size:
+            return None
+        shapes = sorted(set((w, h) for w, h in self.shapes
+                            for d in self.difficulties
+                            if self.is_reachable(w, h, d) and
+                            db.count_pool_boards(conn, w, h, d) < self.size))
+        if not shapes:
+            return None
+        later = [shape for shape in shapes if shape > self.last_shape]
+        self.last_shape = (later or shapes)[0]
+        return self.last_shape
+
+    def give_board(self, conn, board, width, height, room):
+        """
+        Give a new board to the oldest queued request for its shape and
+        difficulty, or else put it in the pool if it has room for its
+        difficulty (room maps difficulties to free places). Otherwise the
+        board is dropped. Return whether the board was used.
+        """
+        difficulty = board.get_difficulty()
+        with self.lock:
+            for request in self.pending:
+                if (request.width, request.height,
+                        request.difficulty) == (width, height, difficulty):
+                    request.count -= 1
+                    if request.count == 0:
+                        self.pending.remove(request)
+                    break
+            else:
+                request = None
+        if request is not None:
+            db.insert_boards(conn, request.uid, [board])
+        elif room.get(difficulty, 0) > 0:
+            room[difficulty] -= 1
+            db.insert_boards(conn, db.POOL_UID, [board])
+        else:
+            return False
+        return True
+
+    def count_misses(self, width, height, wanted, used):
+        """
+        Count the batches in a row of a shape that gave no board of a wanted
+        difficulty. After MAX_MISSES of them, the shape is taken to never
+        reach the difficulty, so the pool stops keeping boards of it, and
+        the queued requests for it are dropped.
+        """
+        with self.lock:
+            for difficulty in wanted | used:
+                key = (width, height, difficulty)
+                if difficulty in used:
+                    self.misses[key] = 0
+                else:
+                    self.misses[key] = self.misses.get(key, 0) + 1
+                    if self.misses[key] == MAX_MISSES:
+                        self.app.logger.warning("No %dx%d board of difficulty "
+                                                "%d in %d batches, giving up",
+                                                width, height, difficulty,
+                                                MAX_MISSES)
+                        self.pending = [request for request in self.pending
+                                        if (request.width, request.height,
+                                            request.difficulty) != key]
+
+    def refill(self, conn):
+        """
+        Create a batch of boards for a queued request, or for the pool. Return whether to wait before the next batch: when there is
+        nothing left to do, or the batch was of no use (some difficulties
+        are rare, or never reached, by some shapes).
+        """
+        shape = self.choose_shape(conn)
+        if shape is None:
+            return True
+        width, height = shape
+        room = {}
+        if self.is_pooled(width, height):
+            room = dict((d, self.size - db.count_pool_boards(conn, width,
+                                                             height, d))
+                        for d in self.difficulties
+                        if self.is_reachable(width, height, d))
+        with self.lock:
+            wanted = set(request.difficulty for request in self.pending
+                         if (request.width, request.height) == shape)
+        wanted.update(d for d, free in room.items() if free > 0)
+        used = set()
+        for board in pysudoku.iter_boards(width, height, REFILL_BATCH):
+            if self.give_board(conn, board, width, height, room):
+                used.add(board.get_difficulty())
+        conn.commit()
+        self.count_misses(width, height, wanted, used)
+        return not used
+
+    def run(self):
+        """
+        The refill thread.
+        """
+        conn = db.connect_db(self.app)
+        while True:
+            try:
+                idle = self.refill(conn)
+            except Exception:
+                self.app.logger.exception("Unable to refill the board pool")
+                conn.rollback()
+                idle = True
+            if idle:
+                self.wakeup.wait(IDLE_WAIT)
+                self.wakeup.clear()
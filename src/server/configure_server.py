@@ -7,10 +7,13 @@ configure_server.py
      Author: eli
 """
 
+from contextlib import closing
 import getpass
 import optparse
 import os
 
+import pysudoku
+
 try:
     import db
     from server import app
@@ -24,11 +27,37 @@ def init_db(root_user, root_password):
     """
     db.init_db(app, root_user, root_password)
 
+def upgrade_db():
+    """
+    Upgrade the application DB to the current schema.
+    """
+    return db.upgrade_db(app)
+
+def rate_board_row(board_row):
+    """
+    Get the difficulty of a board row (from the DB).
+    """
+    board = pysudoku.Board(board_row["problem"], board_row["problem"],
+                           board_row["block_width"], board_row["block_height"])
+    return pysudoku.rate_board(board).get_difficulty()
+
+def rate_boards():
+    """
+    Set the difficulty of the boards created before difficulties were kept.
+    """
+    with closing(db.connect_db(app)) as conn:
+        return db.rate_boards(conn, rate_board_row)
+
 def create_parser():
     """
     Create an argument parser.
     """
     parser = optparse.OptionParser(description="Initialize server DB with a root user")
+    parser.add_option("--upgrade",
+                      action="store_true",
+                      default=False,
+                      dest="upgrade",
+                      help="Upgrade the schema of an existing DB instead")
     parser.add_option("-u", "--user",
                       default=os.environ.get("USER", None),
                       metavar="USERNAME",
@@ -62,6 +91,12 @@ def main():
     Main entry point.
     """
     args, _ = create_parser().parse_args()
+    if args.upgrade:
+        print("Upgrading DB...")
+        print("Applied %d migrations" % upgrade_db())
+        print("Rated %d boards" % rate_boards())
+        return
+    
     user, password = get_username_and_password(args)
     
     print("Initializing DB...")
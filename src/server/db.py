@@ -7,10 +7,69 @@ db.py
 
 from contextlib import closing
 import hashlib
+import itertools
+import os
 import sqlite3
+import threading
 
 import users
 
+# Applied to every new connection. WAL lets readers go on while a
+# request writes, and with it synchronous=NORMAL is still safe.
+CONNECTION_PRAGMAS = ("pragma journal_mode = wal",
+                      "pragma synchronous = normal",
+                      "pragma cache_size = -8192",     # In KiB
+                      "pragma mmap_size = 67108864",
+                      "pragma temp_store = memory")
+
+# Changes to the schema, applied in order on top of schema.sql. The
+# number of applied migrations is kept in the user_version pragma.
+MIGRATIONS = (
+"""
+create index boards_uid_id on boards(uid, id);
+create index boards_uid_create_time on boards(uid, create_time);
+
+alter table users add column num_boards integer not null default 0;
+update users set num_boards = (select count(*) from boards where uid = users.id);
+
+create trigger boards_insert after insert on boards
+begin
+    update users set num_boards = num_boards + 1 where id = new.uid;
+end;
+
+create trigger boards_delete after delete on boards
+begin
+    update users set num_boards = num_boards - 1 where id = old.uid;
+end;
+
+create trigger boards_update_uid after update of uid on boards
+begin
+    update users set num_boards = num_boards - 1 where id = old.uid;
+    update users set num_boards = num_boards + 1 where id = new.uid;
+end;
+""",
+"""
+create index boards_pool on boards(block_width, block_height, id) where uid = 0;
+""",
+"""
+alter table boards add column difficulty integer;
+
+create index boards_uid_difficulty on boards(uid, difficulty, id);
+create index boards_difficulty on boards(difficulty, id);
+
+drop index boards_pool;
+create index boards_pool on boards(block_width, block_height, difficulty, id)
+where uid = 0;
+""",
+)
+
+# Boards of the board pool belong to this (nonexistent) user.
+POOL_UID = 0
+
+GET_SCHEMA_VERSION = """
+pragma user_version
+"""
+
 LOGIN_QUERY = """
 select id, display, permissions from users
 where username = :username and password = :password
@@ -31,8 +90,7 @@ select id, username, display from users
 """
 
 GET_USER_DETAILS = """
-select username, display, permissions,
-    (select count(*) from boards where uid = users.id) as num_boards from users
+select username, display, permissions, num_boards from users
 where users.id = :user_id
 """
 
@@ -62,13 +120,27 @@ where uid = :user_id
 """
 
 INSERT_BOARD = """
-insert into boards(uid, problem, solution, block_width, block_height)
-values (:uid, :problem, :solution, :block_width, :block_height)
+insert into boards(uid, problem, solution, block_width, block_height, difficulty)
+values (:uid, :problem, :solution, :block_width, :block_height, :difficulty)
+"""
+
+LAST_INSERT_ID = """
+select last_insert_rowid()
 """
 
+# Queries with a "%s" take an optional filter, such as DIFFICULTY_FILTER.
+DIFFICULTY_FILTER = "and difficulty = :difficulty"
+
 LIST_USER_BOARDS = """
-select id, create_time, block_width, block_height from boards
-where uid = :uid
+select id, create_time, block_width, block_height, difficulty from boards
+where uid = :uid and id > :after_id %s
+order by id
+limit :limit
+"""
+
+COUNT_USER_BOARDS = """
+select num_boards from users
+where id = :uid
 """
 
 GET_USER_BOARD = """
@@ -77,8 +149,16 @@ where id = :id and uid = :uid
 """
 
 LIST_ALL_BOARDS = """
-select boards.id, create_time, block_width, block_height, users.username, users.display
+select boards.id, create_time, block_width, block_height, difficulty,
+    users.username, users.display
 from boards join users on boards.uid = users.id
+where boards.id > :after_id %s
+order by boards.id
+limit :limit
+"""
+
+COUNT_ALL_BOARDS = """
+select total(num_boards) from users
 """
 
 GET_BOARD = """
@@ -86,6 +166,66 @@ select problem, solution, block_width, block_height from boards
 where id = :id
 """
 
+# The most boards inserted by one statement, so boards given lazily are
+# never all held in memory.
+MAX_BOARDS_PER_INSERT = 500
+
+# The most IDs put in one "id in (...)" query. Old SQLite versions allow
+# at most 999 parameters per statement.
+MAX_IDS_PER_QUERY = 500
+
+GET_BOARDS = """
+select id, problem, solution, block_width, block_height from boards
+where id in (%s)
+"""
+
+GET_USER_BOARDS = GET_BOARDS + """
+and uid = ?
+"""
+
+BEGIN_WRITE = """
+begin immediate
+"""
+
+COUNT_POOL_BOARDS = """
+select count(*) from boards
+where uid = 0 and block_width = :block_width and block_height = :block_height %s
+"""
+
+LIST_POOL_BOARDS = """
+select id from boards
+where uid = 0 and block_width = :block_width and block_height = :block_height %s
+order by id
+limit :limit
+"""
+
+CLAIM_POOL_BOARDS = """
+update boards
+set uid = :uid,
+    create_time = current_timestamp
+where id in (%s)
+""" % LIST_POOL_BOARDS
+
+LIST_UNRATED_BOARDS = """
+select id, problem, block_width, block_height from boards
+where difficulty is null and id > :after_id
+order by id
+limit :limit
+"""
+
+SET_BOARD_DIFFICULTY = """
+update boards
+set difficulty = :difficulty
+where id = :id
+"""
+
+def difficulty_filter(difficulty):
+    """
+    Get the filter of the boards with the given difficulty (all the boards
+    if it is None), for the queries that take a filter.
+    """
+    return "" if difficulty is None else DIFFICULTY_FILTER
+
 def connect_db(app):
     """
     Create a new DB connection.
@@ -93,8 +233,38 @@ def connect_db(app):
     db = sqlite3.connect(app.config["DATABASE"])
     db.row_factory = sqlite3.Row
     db.text_factory = str
+    for pragma in CONNECTION_PRAGMAS:
+        db.execute(pragma)
     return db
 
+# One connection per thread, kept open between requests. The process ID
+# is kept as well, so a forked child never uses its parent's connection.
+_pool = threading.local()
+
+def get_pooled_db(app):
+    """
+    Get the DB connection of the current thread, opening it if needed.
+    """
+    key = (os.getpid(), app.config["DATABASE"])
+    if getattr(_pool, "key", None) != key:
+        _pool.db = connect_db(app)
+        _pool.key = key
+    return _pool.db
+
+def release_pooled_db(db):
+    """
+    Give back a connection taken with get_pooled_db at the end of a request.
+    Anything that was not committed is rolled back, so the connection does
+    not keep holding a lock. A broken connection is dropped from the pool.
+    """
+    try:
+        db.rollback()
+    except sqlite3.Error:
+        if getattr(_pool, "db", None) is db:
+            del _pool.db
+            del _pool.key
+        db.close()
+
 def hash_password(password):
     return hashlib.sha512(password.encode('utf8')).digest()
 
@@ -192,26 +362,79 @@ def delete_user(db, user_id):
     cur.execute(DELETE_USER_BOARDS, details)
     db.commit()
 
+def board_details(uid, board):
+    """
+    Get the row of a new board, as used by INSERT_BOARD.
+    """
+    return {"uid": uid,
+            "problem": board.get_problem(),
+            "solution": board.get_solution(),
+            "block_width": board.get_block_width(),
+            "block_height": board.get_block_height(),
+            "difficulty": board.get_difficulty()}
+
 def insert_board(db, uid, board):
     """
     Insert a new board to the DB, and return its ID.
     """
     
-    details = {"uid": uid,
-               "problem": board.get_problem(),
-               "solution": board.get_solution(),
-               "block_width": board.get_block_width(),
-               "block_height": board.get_block_height()}
     cur = db.cursor()
-    cur.execute(INSERT_BOARD, details)
+    cur.execute(INSERT_BOARD, board_details(uid, board))
     return cur.lastrowid
 
-def list_user_boards(db, uid):
-    details = {"uid": uid}
+def insert_boards(db, uid, boards, commit_every=None):
+    """
+    Insert some new boards to the DB, and return their IDs (in the same order
+    as the boards).
+    boards may be any iterable. It is read lazily, MAX_BOARDS_PER_INSERT
+    boards at a time, so boards that are generated on the fly (see
+    pysudoku.iter_boards) are inserted with constant memory.
+    If commit_every is given, a commit is made after every commit_every
+    boards (or MAX_BOARDS_PER_INSERT, if less), so the write lock is not held
+    while the next ones are generated.
+    Otherwise the caller should commit right after this, so the write lock
+    taken by the insert is held only once for the whole batch.
+    """
+    
+    rows = (board_details(uid, board) for board in boards)
+    batch_size = min(commit_every or MAX_BOARDS_PER_INSERT,
+                     MAX_BOARDS_PER_INSERT)
+    board_ids = []
+    cur = db.cursor()
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        cur.executemany(INSERT_BOARD, batch)
+        # The write lock is held until the commit, so the new boards got
+        # consecutive IDs ending with the last inserted one.
+        last_id = cur.execute(LAST_INSERT_ID).fetchone()[0]
+        board_ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+        if commit_every is not None:
+            db.commit()
+    return board_ids
+
+def list_user_boards(db, uid, after_id=0, limit=None, difficulty=None):
+    """
+    List the boards of a user with an ID greater than after_id, by ID order.
+    At most limit boards are listed (or all of them if limit is None).
+    If difficulty is given, only boards of this difficulty are listed.
+    """
+    details = {"uid": uid,
+               "after_id": after_id,
+               "limit": -1 if limit is None else limit,
+               "difficulty": difficulty}
     cur = db.cursor()
-    cur.execute(LIST_USER_BOARDS, details)
+    cur.execute(LIST_USER_BOARDS % difficulty_filter(difficulty), details)
     return cur.fetchall()
 
+def count_user_boards(db, uid):
+    details = {"uid": uid}
+    cur = db.cursor()
+    cur.execute(COUNT_USER_BOARDS, details)
+    entry = cur.fetchone()
+    return entry[0] if entry is not None else 0
+
 def get_user_board(db, board_id, uid):
     details = {"id": board_id,
                "uid": uid}
@@ -219,17 +442,122 @@ def get_user_board(db, board_id, uid):
     cur.execute(GET_USER_BOARD, details)
     return cur.fetchone()
 
-def list_all_boards(db):
+def list_all_boards(db, after_id=0, limit=None, difficulty=None):
+    """
+    List the boards of all the users with an ID greater than after_id, by ID
+    order. At most limit boards are listed (or all of them if limit is None).
+    If difficulty is given, only boards of this difficulty are listed.
+    """
+    details = {"after_id": after_id,
+               "limit": -1 if limit is None else limit,
+               "difficulty": difficulty}
     cur = db.cursor()
-    cur.execute(LIST_ALL_BOARDS)
+    cur.execute(LIST_ALL_BOARDS % difficulty_filter(difficulty), details)
     return cur.fetchall()
 
+def count_all_boards(db):
+    cur = db.cursor()
+    cur.execute(COUNT_ALL_BOARDS)
+    return int(cur.fetchone()[0])
+
 def get_board(db, board_id):
     details = {"id": board_id}
     cur = db.cursor()
     cur.execute(GET_BOARD, details)
     return cur.fetchone()
 
+def migrate_db(db):
+    """
+    Apply the migrations that were not applied yet to the DB, each one in
+    its own transaction. Return the number of migrations applied.
+    """
+    version = db.execute(GET_SCHEMA_VERSION).fetchone()[0]
+    for new_version in range(version + 1, len(MIGRATIONS) + 1):
+        db.executescript("begin;\n%s\npragma user_version = %d;\ncommit;\n"
+                         % (MIGRATIONS[new_version - 1], new_version))
+    return max(len(MIGRATIONS) - version, 0)
+
+def upgrade_db(app):
+    """
+    Upgrade an existing application DB to the current schema.
+    """
+    with closing(connect_db(app)) as db:
+        return migrate_db(db)
+
+def get_boards(db, board_ids, uid=None):
+    """
+    Get many boards, with as few queries as possible. If uid is given, only
+    boards of this user are found.
+    Return a list with the row of each requested board, in the requested
+    order, where boards that were not found are None.
+    """
+    rows = {}
+    cur = db.cursor()
+    unique_ids = list(set(board_ids))
+    for start in range(0, len(unique_ids), MAX_IDS_PER_QUERY):
+        chunk = unique_ids[start:start + MAX_IDS_PER_QUERY]
+        query = GET_BOARDS if uid is None else GET_USER_BOARDS
+        params = chunk if uid is None else chunk + [uid]
+        cur.execute(query % ", ".join("?" * len(chunk)), params)
+        for row in cur:
+            rows[row["id"]] = row
+    return [rows.get(board_id) for board_id in board_ids]
+
+def count_pool_boards(db, block_width, block_height, difficulty=None):
+    """
+    Count the boards of the given shape (and difficulty, if given) in the
+    board pool.
+    """
+    details = {"block_width": block_width,
+               "block_height": block_height,
+               "difficulty": difficulty}
+    cur = db.cursor()
+    cur.execute(COUNT_POOL_BOARDS % difficulty_filter(difficulty), details)
+    return cur.fetchone()[0]
+
+def take_pool_boards(db, uid, block_width, block_height, count,
+                     difficulty=None):
+    """
+    Move up to count boards of the given shape (and difficulty, if given)
+    from the board pool to a user, and return their IDs. The caller should
+    commit right after this, as the write lock is taken to make sure no one
+    else takes the same boards.
+    """
+    details = {"uid": uid,
+               "block_width": block_width,
+               "block_height": block_height,
+               "limit": count,
+               "difficulty": difficulty}
+    cur = db.cursor()
+    cur.execute(BEGIN_WRITE)
+    cur.execute(LIST_POOL_BOARDS % difficulty_filter(difficulty), details)
+    board_ids = [row[0] for row in cur.fetchall()]
+    if board_ids:
+        cur.execute(CLAIM_POOL_BOARDS % difficulty_filter(difficulty), details)
+    return board_ids
+
+def rate_boards(db, rate, batch_size=1000):
+    """
+    Set the difficulty of the boards that do not have one yet (boards created
+    before difficulties were kept), using rate(board_row) to compute it.
+    Return the number of boards rated.
+    """
+    cur = db.cursor()
+    num_rated = 0
+    after_id = 0
+    while True:
+        cur.execute(LIST_UNRATED_BOARDS, {"after_id": after_id,
+                                          "limit": batch_size})
+        rows = cur.fetchall()
+        if not rows:
+            return num_rated
+        cur.executemany(SET_BOARD_DIFFICULTY,
+                        [{"id": row["id"], "difficulty": rate(row)}
+                         for row in rows])
+        db.commit()
+        num_rated += len(rows)
+        after_id = rows[-1]["id"]
+
 def init_db(app, root_user, root_password):
     """
     Initialize the application DB.
@@ -238,5 +566,6 @@ def init_db(app, root_user, root_password):
         with app.open_resource("schema.sql", "r") as f:
             db.cursor().executescript(f.read())
         db.commit()
+        migrate_db(db)
         register_user(db, root_user, root_password, None,
                       users.UserPermission.PERMISSIONS)
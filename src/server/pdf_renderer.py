@@ -5,11 +5,57 @@ pdf_renderer.py
      Author: eli
 """
 
+from flask import Response
+from flask import current_app
 from flask import send_file
+from multiprocessing.pool import ThreadPool
+import hashlib
 import os
+import re
 import shutil
 import subprocess
 import tempfile
+import threading
+
+import util
+
+### CONSTANTS ###
+
+DEFAULT_PDF_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_PDF_WORKERS = 2
+
+JOB_ID_PATTERN = re.compile("^[0-9a-f]{64}$")
+JOB_STATUS = util.enum("UNKNOWN", "PENDING", "DONE", "FAILED")
+
+# The layout of the native PDF backend, in points. It follows pdf_board.tex:
+# an A4 page with 2cm margins, a \huge title, 1cm cells and 2pt/1pt lines.
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+PAGE_MARGIN = 56.69
+CELL_SIZE = 28.35
+TITLE_FONT_SIZE = 20.74
+ID_FONT_SIZE = 10
+THICK_LINE_WIDTH = 2
+THIN_LINE_WIDTH = 1
+TITLE = "Eli Daian's Sudoku"
+
+# Glyph widths of the Helvetica fonts, in 1/1000 of the font size.
+HELVETICA_WIDTHS = {}
+for chars, width in ((" fIt", 278), ("ijl'", 222), ("r", 333),
+                     ("cksvxyzJ", 500), ("+", 584), ("FTZ", 611),
+                     ("ABEKPSVXY", 667), ("wCDHNRU", 722), ("GOQ", 778),
+                     ("mM", 833), ("W", 944), ("@", 1015)):
+    for char in chars:
+        HELVETICA_WIDTHS[char] = width
+HELVETICA_DEFAULT_WIDTH = 556 # Digits, most lowercase letters, L and #
+HELVETICA_CAP_HEIGHT = 0.718
+
+# The pdflatex workers of this process, and the PDF jobs that run on them
+# (job ID -> AsyncResult).
+_pool = None
+_pool_pid = None
+_jobs = {}
+_lock = threading.Lock()
 
 ### FUNCTIONS ###
 
@@ -26,31 +72,325 @@ def create_env(app):
     texenv.comment_end_string = '=))'
     return texenv
 
+def run_pdflatex(tex, tmp_dir):
+    """
+    Compile the given source in tmp_dir, and return the path of the PDF.
+    """
+    tex_file = os.path.join(tmp_dir, "doc.tex")
+    pdf_file = os.path.join(tmp_dir, "doc.pdf")
+    
+    with open(tex_file, "w") as f:
+        f.write(tex)
+    
+    p = subprocess.Popen(["pdflatex", "-interaction", "nonstopmode", tex_file],
+                         cwd=tmp_dir, stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p.communicate()
+    return pdf_file
+
+def get_pool():
+    """
+    Get the pool of pdflatex workers, which limits the number of pdflatex
+    processes running at the same time to PDF_WORKERS.
+    """
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPool(current_app.config.get("PDF_WORKERS",
+                                                      DEFAULT_PDF_WORKERS))
+            _pool_pid = os.getpid()
+            _jobs.clear()
+        return _pool
+
 def make_pdf(tex, filename):
     """
     Make a PDF file from the given source.
     """
     try:
         tmp_dir = tempfile.mkdtemp()
-        tex_file = os.path.join(tmp_dir, "doc.tex")
-        pdf_file = os.path.join(tmp_dir, "doc.pdf")
-        
-        with open(tex_file, "w") as f:
-            f.write(tex)
-        
-        p = subprocess.Popen(["pdflatex", "-interaction", "nonstopmode", tex_file],
-                             cwd=tmp_dir, stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        p.communicate()
-        
+        pdf_file = get_pool().apply(run_pdflatex, (tex, tmp_dir))
         return send_file(pdf_file, as_attachment=True,
                          attachment_filename=filename)
     finally:
         shutil.rmtree(tmp_dir)
 
+def evict_cached_pdfs(cache_dir, max_size):
+    """
+    Remove the least recently used PDFs from the cache, until the total
+    size of the cached files is at most max_size bytes.
+    """
+    entries = []
+    total_size = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".pdf"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue # Removed by another process
+        entries.append((st.st_mtime, st.st_size, path))
+        total_size += st.st_size
+    
+    entries.sort()
+    for _, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
+
+def get_cached_pdf_path(cache_dir, job_id):
+    return os.path.join(cache_dir, job_id + ".pdf")
+
+def compile_to_cache(tex, cached_file, cache_dir, max_size):
+    """
+    Compile the given source into the PDF cache.
+    """
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass # Created by another worker
+    # Compile next to the cache, so the result can be moved into it
+    # atomically.
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        pdf_file = run_pdflatex(tex, tmp_dir)
+        if not os.path.exists(pdf_file):
+            raise IOError("pdflatex failed to create a PDF")
+        os.rename(pdf_file, cached_file)
+    finally:
+        shutil.rmtree(tmp_dir)
+    evict_cached_pdfs(cache_dir, max_size)
+
+def submit_pdf_job(tex, cache_dir, max_size):
+    """
+    Make a PDF file from the given source in the background, into the PDF
+    cache, and return the ID of the job. If the same source was already
+    compiled, or is being compiled, no new job is started.
+    Return the job ID and the job (None if the PDF is already cached).
+    The cache is addressed by the hash of the source, which holds everything
+    that the PDF depends on: the boards, their IDs, whether the solution is
+    shown, and the template itself. The job ID is this hash.
+    """
+    job_id = hashlib.sha256(tex).hexdigest()
+    cached_file = get_cached_pdf_path(cache_dir, job_id)
+    try:
+        os.utime(cached_file, None) # Mark as recently used
+        return job_id, None
+    except OSError:
+        pass
+    
+    pool = get_pool()
+    with _lock:
+        for done_id in [other_id for other_id, other_job in _jobs.items()
+                        if other_job.ready() and other_job.successful()]:
+            del _jobs[done_id]
+        job = _jobs.get(job_id)
+        if job is None or (job.ready() and not job.successful()):
+            job = _jobs[job_id] = pool.apply_async(compile_to_cache,
+                                                   (tex, cached_file,
+                                                    cache_dir, max_size))
+    return job_id, job
+
+def get_pdf_job_status(job_id):
+    """
+    Get the status of a PDF job, as one of JOB_STATUS.
+    """
+    if not JOB_ID_PATTERN.match(job_id):
+        return JOB_STATUS.UNKNOWN
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.ready():
+            del _jobs[job_id]
+    
+    if job is not None and not job.ready():
+        return JOB_STATUS.PENDING
+    elif os.path.exists(get_cached_pdf_path(get_cache_dir(), job_id)):
+        return JOB_STATUS.DONE
+    elif job is not None:
+        return JOB_STATUS.FAILED
+    else:
+        return JOB_STATUS.UNKNOWN
+
+def send_pdf_job_result(job_id, filename):
+    """
+    Send the PDF made by a finished PDF job.
+    """
+    return send_file(get_cached_pdf_path(get_cache_dir(), job_id),
+                     as_attachment=True, attachment_filename=filename)
+
+def make_cached_pdf(tex, filename, cache_dir, max_size):
+    """
+    Make a PDF file from the given source, or take it from the PDF cache if
+    the same source was already compiled.
+    """
+    job_id, job = submit_pdf_job(tex, cache_dir, max_size)
+    if job is not None:
+        job.get() # Raises if the job failed
+    return send_pdf_job_result(job_id, filename)
+
+def get_cache_dir():
+    return current_app.config.get("PDF_CACHE_DIR")
+
+def get_cache_size():
+    return current_app.config.get("PDF_CACHE_SIZE", DEFAULT_PDF_CACHE_SIZE)
+
+def use_pdf_jobs():
+    """
+    Whether PDFs should be made in the background (when PDF_ASYNC is set).
+    This needs the PDF cache, to keep the results.
+    """
+    return bool(current_app.config.get("PDF_ASYNC") and get_cache_dir())
+
+def render_tex(template, texenv, **kwargs):
+    return texenv.get_template(template).render(**kwargs)
+
 def render_pdf_template(template, texenv, filename=None, **kwargs):
     """
     Render a pdf template.
+    PDFs are cached in PDF_CACHE_DIR if it is configured, using at most
+    PDF_CACHE_SIZE bytes.
+    """
+    tex = render_tex(template, texenv, **kwargs)
+    if not get_cache_dir():
+        return make_pdf(tex, filename)
+    return make_cached_pdf(tex.encode("utf8"), filename, get_cache_dir(),
+                           get_cache_size())
+
+def submit_pdf_template(template, texenv, **kwargs):
+    """
+    Render a pdf template in the background, and return the job ID.
+    """
+    tex = render_tex(template, texenv, **kwargs)
+    job_id, _ = submit_pdf_job(tex.encode("utf8"), get_cache_dir(),
+                               get_cache_size())
+    return job_id
+
+def get_text_width(text, font_size):
+    return sum(HELVETICA_WIDTHS.get(char, HELVETICA_DEFAULT_WIDTH)
+               for char in text) * font_size / 1000.0
+
+def escape_pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def draw_centered_text(font, font_size, x, y, text):
+    """
+    Get the PDF operators that draw text centered around (x, y).
+    """
+    return "BT /%s %.2f Tf %.2f %.2f Td (%s) Tj ET" % (
+        font, font_size, x - get_text_width(text, font_size) / 2,
+        y - HELVETICA_CAP_HEIGHT * font_size / 2, escape_pdf_string(text))
+
+def draw_native_page(board, board_id, is_solution):
+    """
+    Get the PDF content stream of a page with a single board.
+    """
+    width = board.get_block_width()
+    height = board.get_block_height()
+    total_size = width * height
+    # Boards larger than 17 x 17 are shrunk to fit in the page
+    cell_size = min(CELL_SIZE, (PAGE_WIDTH - 2 * PAGE_MARGIN) / total_size)
+    font_size = TITLE_FONT_SIZE * cell_size / CELL_SIZE
+    grid_size = cell_size * total_size
+    left = (PAGE_WIDTH - grid_size) / 2
+    title_y = PAGE_HEIGHT - PAGE_MARGIN - TITLE_FONT_SIZE / 2
+    top = title_y - 2 * TITLE_FONT_SIZE
+    cells = board.get_solution() if is_solution else board.get_problem()
+    
+    ops = [draw_centered_text("F1", TITLE_FONT_SIZE, PAGE_WIDTH / 2, title_y,
+                              TITLE)]
+    
+    # Draw the table grid: the block lines first, then all the cell lines
+    for line_width, x_step, y_step in ((THICK_LINE_WIDTH, width, height),
+                                       (THIN_LINE_WIDTH, 1, 1)):
+        ops.append("%d w" % line_width)
+        for i in range(0, total_size + 1, x_step):
+            x = left + i * cell_size
+            ops.append("%.2f %.2f m %.2f %.2f l S" % (x, top, x, top - grid_size))
+        for i in range(0, total_size + 1, y_step):
+            y = top - i * cell_size
+            ops.append("%.2f %.2f m %.2f %.2f l S" % (left, y, left + grid_size, y))
+    
+    # Draw the cell data
+    for row in range(total_size):
+        for col in range(total_size):
+            symbol = cells[row + col * total_size].strip()
+            if symbol:
+                ops.append(draw_centered_text("F1", font_size,
+                                              left + (row + 0.5) * cell_size,
+                                              top - (col + 0.5) * cell_size,
+                                              symbol))
+    
+    ops.append(draw_centered_text("F2", ID_FONT_SIZE, PAGE_WIDTH / 2,
+                                  top - grid_size - 1.5 * TITLE_FONT_SIZE,
+                                  "#%s" % board_id))
+    return "\n".join(ops)
+
+def generate_native_pdf(boards, is_solution):
+    """
+    Generate a PDF of the given boards (pairs of a board and its ID), with a
+    page per board, piece by piece.
+    Object 1 is the catalog and object 2 is the page tree, which is written
+    last, when all the pages are known. The fonts are the standard Helvetica
+    fonts, which PDF viewers always have, so nothing is embedded.
+    """
+    offsets = {}
+    position = [0]
+    
+    def write_object(number, body):
+        offsets[number] = position[0]
+        data = "%d 0 obj\n%s\nendobj\n" % (number, body)
+        position[0] += len(data)
+        return data
+    
+    def write(data):
+        position[0] += len(data)
+        return data
+    
+    yield write("%PDF-1.4\n")
+    yield write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+    yield write_object(3, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    yield write_object(4, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Oblique >>")
+    
+    pages = []
+    number = 5
+    for board, board_id in boards:
+        content = draw_native_page(board, board_id, is_solution)
+        yield write_object(number, "<< /Length %d >>\nstream\n%s\nendstream"
+                                   % (len(content), content))
+        yield write_object(number + 1,
+                           "<< /Type /Page /Parent 2 0 R "
+                           "/MediaBox [0 0 %.2f %.2f] /Contents %d 0 R "
+                           "/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>"
+                           % (PAGE_WIDTH, PAGE_HEIGHT, number))
+        pages.append(number + 1)
+        number += 2
+    
+    yield write_object(2, "<< /Type /Pages /Kids [%s] /Count %d >>"
+                          % (" ".join("%d 0 R" % page for page in pages), len(pages)))
+    
+    xref_position = position[0]
+    yield "xref\n0 %d\n0000000000 65535 f \n" % number
+    yield "".join("%010d 00000 n \n" % offsets[i] for i in range(1, number))
+    yield ("trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+           % (number, xref_position))
+
+def use_native_backend():
+    """
+    Whether PDFs should be written directly (PDF_BACKEND = "native") instead
+    of with pdflatex (PDF_BACKEND = "latex", the default).
+    """
+    return current_app.config.get("PDF_BACKEND", "latex") == "native"
+
+def send_native_pdf(boards, is_solution, filename):
+    """
+    Stream a PDF of the given boards, written without LaTeX.
     """
-    tex = texenv.get_template(template).render(**kwargs)
-    return make_pdf(tex, filename)
+    return Response(generate_native_pdf(boards, is_solution),
+                    mimetype="application/pdf",
+                    headers={"Content-Disposition":
+                             "attachment; filename=%s" % filename})
@@ -1,3 +1,5 @@
+pragma user_version = 0;
+
 drop table if exists users;
 create table users (
     id integer primary key autoincrement,
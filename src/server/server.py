@@ -5,10 +5,9 @@ server.py
      Author: eli
 """
 
-import base64
-import pickle
-import zlib
+import json
 from flask import Flask
+from flask import Response
 from flask import flash
 from flask import g
 from flask import redirect
@@ -16,11 +15,13 @@ from flask import render_template
 from flask import request
 from flask import send_from_directory
 from flask import session
+from flask import stream_with_context
 from flask import url_for
 from functools import wraps
 
 import pysudoku
 
+import board_pool
 import db
 import pdf_renderer
 import users
@@ -29,6 +30,11 @@ import util
 ### CONSTANTS ###
 
 BOARD_MODES = util.enum("INSITE", "PRINT", "PDF")
+MAX_BOARDS_PER_SET = 10000
+DIFFICULTIES = [(pysudoku.DIFFICULTY_EASY, "Easy"),
+                (pysudoku.DIFFICULTY_MEDIUM, "Medium"),
+                (pysudoku.DIFFICULTY_HARD, "Hard")]
+DEFAULT_BOARDS_PER_PAGE = 100
 
 ### FUNCTIONS ###
 
@@ -36,6 +42,7 @@ app = Flask(__name__)
 app.config.from_envvar("SUDOKU_SERVER_CONF_FILE")
 
 texenv = pdf_renderer.create_env(app)
+ready_boards = board_pool.BoardPool(app, [value for value, name in DIFFICULTIES])
 
 def get_board_from_board_row(board_row):
     """
@@ -47,33 +54,81 @@ def get_board_from_board_row(board_row):
 
 def create_boards_string(boards):
     """
-    Returns a base-64 compressed pickle of the boards.
+    Returns a short URL-safe string with the board IDs.
     """
-    return base64.b64encode(zlib.compress(pickle.dumps(boards)))
+    return util.encode_id_list(boards)
 
 
 def read_boards_string(boards_string):
     """
     A reversed function to create_boards_string.
     """
-    return pickle.loads(zlib.decompress(base64.b64decode(boards_string)))
+    return util.decode_id_list(boards_string, MAX_BOARDS_PER_SET)
 
 
-@app.before_request
-def open_db():
+def get_db():
     """
-    Initialize a DB connection before any request.
+    Get the DB connection of the current request. It is taken from the
+    connection pool on first use, so requests that never touch the DB
+    never open a connection.
     """
-    g.db = db.connect_db(app)
+    conn = getattr(g, "db", None)
+    if conn is None:
+        conn = g.db = db.get_pooled_db(app)
+    return conn
+
+def get_current_user():
+    """
+    Get the logged in user. It is read from the DB only once per request.
+    """
+    user = getattr(g, "curr_user", None)
+    if user is None:
+        user = g.curr_user = db.get_user(get_db(), session["user"])
+    return user
+
+@app.before_first_request
+def start_board_pool():
+    """
+    Start refilling the board pool once the server is up.
+    """
+    ready_boards.start()
 
 @app.teardown_request
-def close_db(exception):
+def release_db(exception):
     """
-    Close the DB connection after any request.
+    Give the DB connection back to the pool after any request.
     """
     conn = getattr(g, "db", None)
     if conn is not None:
-        conn.close()
+        db.release_pooled_db(conn)
+
+def get_page_args():
+    """
+    Get the pagination arguments of a board listing request: the ID after
+    which the page starts, and the number of boards in the page.
+    """
+    per_page = app.config.get("BOARDS_PER_PAGE", DEFAULT_BOARDS_PER_PAGE)
+    after_id = request.args.get("after", 0, type=int)
+    limit = request.args.get("limit", per_page, type=int)
+    return after_id, max(1, min(limit, per_page))
+
+def get_next_after(boards, limit):
+    """
+    Get the ID after which the next page of a listing starts, or None if
+    this is the last page.
+    """
+    return boards[-1]["id"] if len(boards) == limit else None
+
+def stream_boards_json(boards, limit):
+    """
+    Stream a page of board rows as a JSON object, one board at a time.
+    """
+    def generate():
+        yield '{"boards": ['
+        for i, board in enumerate(boards):
+            yield (", " if i else "") + json.dumps(dict(zip(board.keys(), board)))
+        yield '], "next_after": %s}' % json.dumps(get_next_after(boards, limit))
+    return Response(stream_with_context(generate()), mimetype="application/json")
 
 def sslify(func):
     """
@@ -98,7 +153,7 @@ def must_login(permission=None):
         def wrapped(*args, **kwargs):
             if not session.get("logged_in"):
                 return redirect(url_for("login", next=request.url))
-            elif permission is not None and not db.get_user(g.db, session["user"]).has_permission(permission):
+            elif permission is not None and not get_current_user().has_permission(permission):
                 flash("Permission denied", "danger")
                 return redirect(url_for("main_page"))
             else:
@@ -106,6 +161,28 @@ def must_login(permission=None):
         return wrapped
     return wrapper
 
+def render_pdf(filename, boards, is_solution, multi_board):
+    """
+    Render a PDF of boards (pairs of a board and its ID).
+    With PDF_BACKEND = "native" the PDF is written directly and streamed.
+    Otherwise it is made by pdflatex, and if PDF_ASYNC is set this is done in
+    the background and the viewer is sent to wait for it.
+    """
+    if pdf_renderer.use_native_backend():
+        return pdf_renderer.send_native_pdf(boards, is_solution, filename)
+    
+    if multi_board:
+        kwargs = {"boards": boards}
+    else:
+        kwargs = {"board": boards[0][0], "id": boards[0][1]}
+    kwargs.update(is_solution=is_solution, multi_board=multi_board)
+    if pdf_renderer.use_pdf_jobs():
+        job_id = pdf_renderer.submit_pdf_template("pdf_board.tex", texenv,
+                                                  **kwargs)
+        return redirect(url_for("pdf_job", job_id=job_id, filename=filename))
+    return pdf_renderer.render_pdf_template("pdf_board.tex", texenv,
+                                            filename=filename, **kwargs)
+
 def view_one_board(board_id, board_row, solution, mode, root):
     """
     View a single board.
@@ -118,7 +195,7 @@ def view_one_board(board_id, board_row, solution, mode, root):
     board = get_board_from_board_row(board_row)
     
     if mode == BOARD_MODES.INSITE:
-        user = db.get_user(g.db, session["user"])
+        user = get_current_user()
         return render_template("view_board.html", function="view", board=board,
                                id=board_id, is_solution=solution, modes=BOARD_MODES,
                                root=root, curr_user=user)
@@ -127,11 +204,7 @@ def view_one_board(board_id, board_row, solution, mode, root):
                                id=board_id, is_solution=solution)
     elif mode == BOARD_MODES.PDF:
         filename = "solution.pdf" if solution else "board.pdf"
-        return pdf_renderer.render_pdf_template("pdf_board.tex", texenv,
-                                                filename=filename,
-                                                board=board, id=board_id,
-                                                is_solution=solution,
-                                                multi_board=False)
+        return render_pdf(filename, [(board, board_id)], solution, False)
     else:
         flash("Invalid mode", "warning")
         return redirect(url_for("main_page"))
@@ -164,7 +237,7 @@ def view_many_boards(board_ids, board_rows, solution, mode, root):
     boards_str = create_boards_string(board_ids)
     
     if mode == BOARD_MODES.INSITE:
-        user = db.get_user(g.db, session["user"])
+        user = get_current_user()
         return render_template("view_board.html", function="view_many", boards=boards,
                                is_solution=solution, modes=BOARD_MODES,
                                boards_str=boards_str, root=root, curr_user=user)
@@ -173,11 +246,7 @@ def view_many_boards(board_ids, board_rows, solution, mode, root):
                                is_solution=solution)
     elif mode == BOARD_MODES.PDF:
         filename = "solutions.pdf" if solution else "boards.pdf"
-        return pdf_renderer.render_pdf_template("pdf_board.tex", texenv,
-                                                filename=filename,
-                                                boards=boards, id=board_id,
-                                                is_solution=solution,
-                                                multi_board=True)
+        return render_pdf(filename, boards, solution, True)
     else:
         flash("Invalid mode", "warning")
         return redirect(url_for("main_page"))
@@ -190,7 +259,7 @@ def main_page():
     Displays available boards, and link for board generation.
     """
     if session.get("logged_in", False):
-        user = db.get_user(g.db, session["user"])
+        user = get_current_user()
     else:
         user = None
     return render_template("main_page.html", curr_user=user)
@@ -206,7 +275,7 @@ def login():
             username = request.form["username"]
             password = request.form["password"]
             
-            user = db.login(g.db, username, password)
+            user = db.login(get_db(), username, password)
             if user is None:
                 flash("Invalid login credentials", "danger")
             else:
@@ -256,26 +325,49 @@ def create_board():
             else:
                 raise util.ErrorWithMessage("Invalid board type")
             count = int(request.form["count"])
-            
-            boards = pysudoku.create_board(width, height, count)
-            board_ids = [db.insert_board(g.db, session["user"], board)
-                         for board in boards]
-            g.db.commit()
-            session["last_boards"] = board_ids
-            if len(board_ids) == 1:
-                flash("Created one board", "success")
+            if count < 1 or count > MAX_BOARDS_PER_SET:
+                raise util.ErrorWithMessage("Between 1 and %d boards can be created at once" %
+                                            MAX_BOARDS_PER_SET)
+            if request.form.get("difficulty", ""):
+                difficulty = int(request.form["difficulty"])
+                if difficulty not in dict(DIFFICULTIES):
+                    raise util.ErrorWithMessage("Invalid difficulty")
             else:
-                flash("Created %d boards" % len(board_ids), "success")
-            just_created = True
+                difficulty = None
+            
+            try:
+                board_ids, num_queued = ready_boards.take_boards(
+                    get_db(), session["user"], width, height, count, difficulty)
+            except ValueError:
+                raise util.ErrorWithMessage("Invalid board dimensions")
+            if num_queued:
+                flash("%d boards of this difficulty are being created, and will "
+                      "be added to your boards when ready" % num_queued,
+                      "warning")
+            if len(board_ids) + num_queued < count:
+                flash("%d boards of this difficulty could not be created (boards "
+                      "of this size may never be this difficult, or too many of "
+                      "your boards are being created)"
+                      % (count - len(board_ids) - num_queued), "warning")
+            if board_ids:
+                # Only the short string is kept, so the session cookie stays small
+                session["last_boards"] = create_boards_string(board_ids)
+                session["num_last_boards"] = len(board_ids)
+                if len(board_ids) == 1:
+                    flash("Created one board", "success")
+                else:
+                    flash("Created %d boards" % len(board_ids), "success")
+                just_created = True
         except util.ErrorWithMessage as e:
             flash(e.message, "danger")
         except (KeyError, ValueError):
             flash("Invalid request data", "danger")
         except:
             flash("Internal server error", "danger")
-    user = db.get_user(g.db, session["user"])
+    user = get_current_user()
     return render_template("create_board.html", just_created=just_created,
-                           curr_user=user)
+                           difficulties=DIFFICULTIES,
+                           max_boards=MAX_BOARDS_PER_SET, curr_user=user)
 
 @app.route("/view")
 @sslify
@@ -289,7 +381,7 @@ def view_board():
                                 board_id=request.args["board_id"],
                                 solution=request.args.get("solution", "0")))
     
-    user = db.get_user(g.db, session["user"])
+    user = get_current_user()
     return render_template("view_board.html", function="main", root=False,
                            curr_user=user)
 
@@ -299,15 +391,33 @@ def view_board():
 @must_login(users.PERM_CREATE_BOARD)
 def list_boards(many):
     """
-    List the available user boards.
+    List the available user boards, one page at a time.
     """
     
-    boards = db.list_user_boards(g.db, session["user"])
-    user = db.get_user(g.db, session["user"])
-    return render_template("view_board.html", boards=boards,
+    after_id, limit = get_page_args()
+    difficulty = request.args.get("difficulty", type=int)
+    boards = db.list_user_boards(get_db(), session["user"], after_id, limit,
+                                 difficulty)
+    num_boards = db.count_user_boards(get_db(), session["user"])
+    user = get_current_user()
+    return render_template("view_board.html", boards=boards, num_boards=num_boards,
+                           after_id=after_id, next_after=get_next_after(boards, limit),
+                           difficulty=difficulty, difficulties=DIFFICULTIES,
                            function="list_many" if many else "list", root=False,
                            curr_user=user)
 
+@app.route("/view/list.json")
+@sslify
+@must_login(users.PERM_CREATE_BOARD)
+def list_boards_json():
+    """
+    List a page of the available user boards as JSON.
+    """
+    after_id, limit = get_page_args()
+    boards = db.list_user_boards(get_db(), session["user"], after_id, limit,
+                                 request.args.get("difficulty", type=int))
+    return stream_boards_json(boards, limit)
+
 @app.route("/view/last")
 @sslify
 @must_login(users.PERM_CREATE_BOARD)
@@ -318,8 +428,7 @@ def view_last_boards():
     if "last_boards" not in session:
         flash("You have not created any board in this session", "info")
         return redirect(url_for("view_board"))
-    boards = create_boards_string(session["last_boards"])
-    return redirect(url_for("view_board_set", boards=boards))
+    return redirect(url_for("view_board_set", boards=session["last_boards"]))
 
 @app.route("/view/<int:board_id>",
            defaults={"solution": 0, "mode": BOARD_MODES.INSITE})
@@ -332,7 +441,7 @@ def view_specific_board(board_id, solution, mode):
     """
     View a board.
     """
-    board_row = db.get_user_board(g.db, board_id, session["user"])
+    board_row = db.get_user_board(get_db(), board_id, session["user"])
     return view_one_board(board_id, board_row, solution, mode, False)
 
 @app.route("/view/custom", methods=["GET", "POST"],
@@ -350,8 +459,7 @@ def view_board_set(solution, mode):
         return redirect(url_for("view_specific_board", board_id=board_ids[0],
                                 solution=solution, mode=mode))
     
-    board_rows = [(db.get_user_board(g.db, board_id, session["user"]), board_id)
-                  for board_id in board_ids]
+    board_rows = zip(db.get_boards(get_db(), board_ids, session["user"]), board_ids)
     return view_many_boards(board_ids, board_rows, solution, mode, False)
 
 @app.route("/register", methods=["GET", "POST"])
@@ -361,7 +469,7 @@ def register_user():
     """
     Register a new user account.
     """
-    curr_user = db.get_user(g.db, session["user"])
+    curr_user = get_current_user()
     if request.method == "POST":
         try:
             username = request.form["username"]
@@ -385,7 +493,7 @@ def register_user():
                         request.form[permission.name] == str(permission.flag):
                     permissions.append(permission)
             
-            message, status = db.register_user(g.db, username, password, display,
+            message, status = db.register_user(get_db(), username, password, display,
                                                permissions)
             flash(message, "success" if status else "danger")
         except KeyError:
@@ -399,8 +507,8 @@ def manage_users():
     """
     Manage the other users.
     """
-    users = db.list_users(g.db)
-    curr_user = db.get_user(g.db, session["user"])
+    users = db.list_users(get_db())
+    curr_user = get_current_user()
     return render_template("manage.html", function="main", users=users,
                            curr_user=curr_user)
 
@@ -434,21 +542,22 @@ def edit_user(user_id):
                     permissions.append(permission)
             
             if has_password:
-                db.edit_user_with_password(g.db, user_id, password, display, permissions)
+                db.edit_user_with_password(get_db(), user_id, password, display, permissions)
             else:
-                db.edit_user_without_password(g.db, user_id, display, permissions)
+                db.edit_user_without_password(get_db(), user_id, display, permissions)
+            g.curr_user = None # The editor might have edited their own user
             
             flash("User updated successfully", "success")
         except KeyError:
             flash("Invalid sent form", "danger")
     
-    user_details = db.get_user_details(g.db, user_id)
+    user_details = db.get_user_details(get_db(), user_id)
     if not user_details:
         flash("User not found", "danger")
         return redirect(url_for("manage_users"))
     user = users.User(user_id, user_details["username"],
                       user_details["display"], user_details["permissions"])
-    curr_user = db.get_user(g.db, session["user"])
+    curr_user = get_current_user()
     
     return render_template("manage.html", function="edit", user_id=user_id,
                            user=user, user_details=user_details,
@@ -462,7 +571,7 @@ def delete_user(user_id):
     Delete a user.
     """
     
-    user_details = db.get_user_details(g.db, user_id)
+    user_details = db.get_user_details(get_db(), user_id)
     if not user_details:
         flash("User not found", "danger")
         return redirect(url_for("manage_users"))
@@ -476,13 +585,13 @@ def delete_user(user_id):
             if user_id != user_id2 or approved != 1:
                 raise RuntimeError
             
-            db.delete_user(g.db, user_id)
+            db.delete_user(get_db(), user_id)
             flash("User %s has been deleted successfully" % user.display, "success")
             return redirect(url_for("manage_users"))
         except:
             flash("Unknown data received", "danger")
     
-    curr_user = db.get_user(g.db, session["user"])
+    curr_user = get_current_user()
     return render_template("manage.html", function="delete", user_id=user_id,
                            user=user, user_details=user_details,
                            curr_user=curr_user)
@@ -499,7 +608,7 @@ def other_user():
                                 board_id=request.args["board_id"],
                                 solution=request.args.get("solution", "0")))
     
-    curr_user = db.get_user(g.db, session["user"])
+    curr_user = get_current_user()
     return render_template("view_board.html", function="main", root=True,
                            curr_user=curr_user)
 
@@ -509,14 +618,31 @@ def other_user():
 @must_login(users.PERM_SHOW_OTHER_USER_BOARDS)
 def list_other_boards(many):
     """
-    List all the boards of the other users.
+    List all the boards of the other users, one page at a time.
     """
-    boards = db.list_all_boards(g.db)
-    curr_user = db.get_user(g.db, session["user"])
-    return render_template("view_board.html", boards=boards,
+    after_id, limit = get_page_args()
+    difficulty = request.args.get("difficulty", type=int)
+    boards = db.list_all_boards(get_db(), after_id, limit, difficulty)
+    num_boards = db.count_all_boards(get_db())
+    curr_user = get_current_user()
+    return render_template("view_board.html", boards=boards, num_boards=num_boards,
+                           after_id=after_id, next_after=get_next_after(boards, limit),
+                           difficulty=difficulty, difficulties=DIFFICULTIES,
                            function="list_many" if many else "list", root=True,
                            curr_user=curr_user)
 
+@app.route("/other/list.json")
+@sslify
+@must_login(users.PERM_SHOW_OTHER_USER_BOARDS)
+def list_other_boards_json():
+    """
+    List a page of all the boards of the other users as JSON.
+    """
+    after_id, limit = get_page_args()
+    boards = db.list_all_boards(get_db(), after_id, limit,
+                                request.args.get("difficulty", type=int))
+    return stream_boards_json(boards, limit)
+
 @app.route("/other/<int:board_id>",
            defaults={"solution": 0, "mode": BOARD_MODES.INSITE})
 @app.route("/other/<int:board_id>/<int:solution>",
@@ -528,7 +654,7 @@ def other_specific_board(board_id, solution, mode):
     """
     View a specific board of other users.
     """
-    board_row = db.get_board(g.db, board_id)
+    board_row = db.get_board(get_db(), board_id)
     return view_one_board(board_id, board_row, solution, mode, True)
 
 @app.route("/other/custom", methods=["GET", "POST"],
@@ -552,9 +678,42 @@ def other_board_set(solution, mode):
         return redirect(url_for("other_specific_board", board_id=board_ids[0],
                                 solution=solution, mode=mode))
     
-    board_rows = [(db.get_board(g.db, board_id), board_id) for board_id in board_ids]
+    board_rows = zip(db.get_boards(get_db(), board_ids), board_ids)
     return view_many_boards(board_ids, board_rows, solution, mode, True)
 
+@app.route("/pdf/<job_id>/<filename>")
+@sslify
+@must_login()
+def pdf_job(job_id, filename):
+    """
+    Show the status of a PDF being made in the background, and send the
+    viewer to download it once it is ready.
+    """
+    status = pdf_renderer.get_pdf_job_status(job_id)
+    if status == pdf_renderer.JOB_STATUS.DONE:
+        return redirect(url_for("download_pdf_job", job_id=job_id,
+                                filename=filename))
+    elif status == pdf_renderer.JOB_STATUS.FAILED:
+        flash("Unable to create the PDF", "danger")
+        return redirect(url_for("main_page"))
+    elif status == pdf_renderer.JOB_STATUS.UNKNOWN:
+        flash("PDF not found", "warning")
+        return redirect(url_for("main_page"))
+    
+    user = get_current_user()
+    return render_template("pdf_job.html", curr_user=user)
+
+@app.route("/pdf/<job_id>/<filename>/download")
+@sslify
+@must_login()
+def download_pdf_job(job_id, filename):
+    """
+    Download a PDF made in the background.
+    """
+    if pdf_renderer.get_pdf_job_status(job_id) != pdf_renderer.JOB_STATUS.DONE:
+        return redirect(url_for("pdf_job", job_id=job_id, filename=filename))
+    return pdf_renderer.send_pdf_job_result(job_id, filename)
+
 @app.route("/fonts/<path:filename>")
 def get_font(filename):
     """
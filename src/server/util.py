@@ -5,6 +5,13 @@ util.py
      Author: eli
 """
 
+import base64
+import binascii
+import re
+
+# The characters of unpadded URL-safe base64
+TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]*\Z")
+
 class ErrorWithMessage(Exception):
     """
     This exception has a message to be passed to the viewer.
@@ -19,3 +26,76 @@ class ErrorWithMessage(Exception):
 def enum(*sequential, **named):
     enums = dict(zip(sequential, range(len(sequential))), **named)
     return type('Enum', (), enums)
+
+def write_varint(buf, value):
+    """
+    Append a non-negative integer to a bytearray, 7 bits per byte.
+    """
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def read_varint(buf, pos):
+    """
+    Read an integer written by write_varint at the given position of a
+    bytearray, and return it with the position after it.
+    """
+    value = shift = 0
+    while True:
+        if pos >= len(buf) or shift > 63:
+            raise ValueError("Truncated varint")
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+def encode_id_list(ids):
+    """
+    Encode a list of positive integer IDs as a short URL-safe string.
+    Every run of consecutive IDs is written as two varints: the distance of
+    its first ID from the end of the previous run (zigzag encoded, so runs
+    may go backwards too) and its length.
+    """
+    buf = bytearray()
+    prev_end = 0
+    i = 0
+    while i < len(ids):
+        start = ids[i]
+        j = i + 1
+        while j < len(ids) and ids[j] == ids[j - 1] + 1:
+            j += 1
+        delta = start - prev_end
+        write_varint(buf, delta * 2 if delta >= 0 else -delta * 2 - 1)
+        write_varint(buf, j - i)
+        prev_end = start + (j - i)
+        i = j
+    return base64.urlsafe_b64encode(bytes(buf)).decode("ascii").rstrip("=")
+
+def decode_id_list(token, max_ids):
+    """
+    Decode a string made by encode_id_list. Raise ValueError if it is not
+    valid, or if it holds more than max_ids IDs.
+    """
+    token = str(token)
+    # base64 skips unknown characters, so they are rejected here
+    if not TOKEN_PATTERN.match(token):
+        raise ValueError("Invalid ID list")
+    try:
+        buf = bytearray(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (TypeError, binascii.Error):
+        raise ValueError("Invalid ID list")
+    ids = []
+    prev_end = 0
+    pos = 0
+    while pos < len(buf):
+        delta, pos = read_varint(buf, pos)
+        length, pos = read_varint(buf, pos)
+        start = prev_end + (delta // 2 if not delta & 1 else -(delta + 1) // 2)
+        if length < 1 or start < 1 or len(ids) + length > max_ids:
+            raise ValueError("Invalid ID list")
+        ids.extend(range(start, start + length))
+        prev_end = start + length
+    return ids
@@ -0,0 +1,156 @@
+"""
+test_db.py
+
+ Created on: Oct 18 2026
+"""
+
+import os
+import sys
+import unittest
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, os.pardir, "src", "server")
+sys.path.insert(0, SERVER_DIR)
+
+import db
+
+class App(object):
+    """
+    The part of the Flask application used by db.connect_db.
+    """
+
+    config = {"DATABASE": ":memory:"}
+
+class Board(object):
+    """
+    The part of pysudoku.Board used by db.insert_boards.
+    """
+
+    def __init__(self, number, block_width=3, block_height=3, difficulty=0):
+        self.number = number
+        self.block_width = block_width
+        self.block_height = block_height
+        self.difficulty = difficulty
+
+    def get_problem(self):
+        return "problem %d" % self.number
+
+    def get_solution(self):
+        return "solution %d" % self.number
+
+    def get_block_width(self):
+        return self.block_width
+
+    def get_block_height(self):
+        return self.block_height
+
+    def get_difficulty(self):
+        return self.difficulty
+
+def create_baseline_db():
+    """
+    Create an in-memory DB with the schema before any migration.
+    """
+    conn = db.connect_db(App())
+    with open(os.path.join(SERVER_DIR, "schema.sql")) as f:
+        conn.executescript(f.read())
+    return conn
+
+def get_version(conn):
+    return conn.execute(db.GET_SCHEMA_VERSION).fetchone()[0]
+
+class MigrationTest(unittest.TestCase):
+    """
+    Tests of upgrading the schema with db.migrate_db.
+    """
+
+    def test_migrate_baseline(self):
+        conn = create_baseline_db()
+        self.assertEqual(get_version(conn), 0)
+        conn.execute("insert into users (username, password, permissions) "
+                     "values ('user', '', 0)")
+        conn.executemany("insert into boards (uid, problem, solution, "
+                         "block_width, block_height) values (1, '', '', 3, 3)",
+                         [()] * 3)
+        conn.commit()
+
+        self.assertEqual(db.migrate_db(conn), len(db.MIGRATIONS))
+        self.assertEqual(get_version(conn), len(db.MIGRATIONS))
+        # Boards from before the migration are counted
+        self.assertEqual(db.count_user_boards(conn, 1), 3)
+        self.assertEqual(db.migrate_db(conn), 0)
+        self.assertEqual(get_version(conn), len(db.MIGRATIONS))
+
+    def test_migrate_partly_migrated(self):
+        conn = create_baseline_db()
+        conn.executescript(db.MIGRATIONS[0] + "\npragma user_version = 1;")
+        self.assertEqual(db.migrate_db(conn), len(db.MIGRATIONS) - 1)
+        self.assertEqual(get_version(conn), len(db.MIGRATIONS))
+
+class BoardsTest(unittest.TestCase):
+    """
+    Tests of inserting boards and of the board pool.
+    """
+
+    def setUp(self):
+        self.conn = create_baseline_db()
+        db.migrate_db(self.conn)
+        db.register_user(self.conn, "user", "password", None, [])
+        self.uid = db.login(self.conn, "user", "password").id
+
+    def test_insert_many(self):
+        count = db.MAX_BOARDS_PER_INSERT * 2 + 3
+        board_ids = db.insert_boards(self.conn, self.uid,
+                                     (Board(i) for i in range(count)))
+        self.conn.commit()
+        self.assertEqual(len(board_ids), count)
+        self.assertEqual(len(set(board_ids)), count)
+        for number, board_id in enumerate(board_ids):
+            row = db.get_board(self.conn, board_id)
+            self.assertEqual(row["problem"], "problem %d" % number)
+        self.assertEqual(db.count_user_boards(self.conn, self.uid), count)
+
+    def test_insert_with_commits(self):
+        first_ids = db.insert_boards(self.conn, self.uid, [Board(0)])
+        board_ids = db.insert_boards(self.conn, self.uid,
+                                     (Board(i) for i in range(1, 30)), 7)
+        self.assertEqual(board_ids, list(range(first_ids[0] + 1,
+                                               first_ids[0] + 30)))
+        self.assertEqual(db.count_user_boards(self.conn, self.uid), 30)
+
+    def test_take_pool_boards(self):
+        pool_ids = db.insert_boards(self.conn, db.POOL_UID,
+                                    [Board(0, difficulty=0),
+                                     Board(1, difficulty=1),
+                                     Board(2, difficulty=1),
+                                     Board(3, 4, 3, difficulty=1),
+                                     Board(4, difficulty=1)])
+        self.conn.commit()
+        self.assertEqual(db.count_pool_boards(self.conn, 3, 3), 4)
+        self.assertEqual(db.count_pool_boards(self.conn, 3, 3, 1), 3)
+
+        board_ids = db.take_pool_boards(self.conn, self.uid, 3, 3, 2, 1)
+        self.conn.commit()
+        self.assertEqual(board_ids, [pool_ids[1], pool_ids[2]])
+        self.assertEqual(db.count_user_boards(self.conn, self.uid), 2)
+        self.assertEqual(db.count_pool_boards(self.conn, 3, 3, 1), 1)
+        for board_id in board_ids:
+            self.assertTrue(db.get_user_board(self.conn, board_id, self.uid))
+
+        board_ids = db.take_pool_boards(self.conn, self.uid, 3, 3, 5)
+        self.conn.commit()
+        self.assertEqual(board_ids, [pool_ids[0], pool_ids[4]])
+        self.assertEqual(db.count_user_boards(self.conn, self.uid), 4)
+        self.assertEqual(db.count_pool_boards(self.conn, 3, 3), 0)
+        self.assertEqual(db.count_pool_boards(self.conn, 4, 3), 1)
+        self.assertEqual(db.take_pool_boards(self.conn, self.uid, 3, 3, 1), [])
+
+    def test_delete_user(self):
+        db.insert_boards(self.conn, self.uid, [Board(0), Board(1)])
+        self.conn.commit()
+        self.assertEqual(db.count_all_boards(self.conn), 2)
+        db.delete_user(self.conn, self.uid)
+        self.assertEqual(db.count_all_boards(self.conn), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+test_util.py
+
+ Created on: Oct 18 2026
+"""
+
+import base64
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir, "src", "server"))
+
+import util
+
+# As in server.py (which needs Flask to be imported)
+MAX_BOARDS_PER_SET = 10000
+
+def make_token(data):
+    """
+    Make a token of the given bytes, valid or not.
+    """
+    return base64.urlsafe_b64encode(bytes(bytearray(data))).decode("ascii") \
+        .rstrip("=")
+
+class IdListTest(unittest.TestCase):
+    """
+    Tests of encode_id_list and decode_id_list.
+    """
+
+    def assert_round_trip(self, ids):
+        token = util.encode_id_list(ids)
+        self.assertTrue(util.TOKEN_PATTERN.match(token))
+        self.assertEqual(util.decode_id_list(token, MAX_BOARDS_PER_SET), ids)
+
+    def test_empty(self):
+        self.assertEqual(util.encode_id_list([]), "")
+        self.assertEqual(util.decode_id_list("", MAX_BOARDS_PER_SET), [])
+
+    def test_round_trip(self):
+        self.assert_round_trip([1])
+        self.assert_round_trip([127, 128, 129])
+        self.assert_round_trip(list(range(1, 1001)))
+        self.assert_round_trip([5, 3, 4, 1, 2**40, 2**40 + 1, 7])
+        self.assert_round_trip([10, 10, 9])
+
+    def test_random_round_trip(self):
+        rand = random.Random(0)
+        for _ in range(200):
+            ids = []
+            for _ in range(rand.randint(1, 50)):
+                start = rand.randint(1, 10 ** rand.randint(1, 12))
+                ids.extend(range(start, start + rand.randint(1, 5)))
+            self.assert_round_trip(ids)
+
+    def test_runs_are_short(self):
+        token = util.encode_id_list(list(range(1000, 1000 + MAX_BOARDS_PER_SET)))
+        self.assertTrue(len(token) < 10)
+
+    def test_cap(self):
+        ids = list(range(1, MAX_BOARDS_PER_SET + 1))
+        self.assert_round_trip(ids)
+        token = util.encode_id_list(ids + [MAX_BOARDS_PER_SET + 5])
+        self.assertRaises(ValueError, util.decode_id_list, token,
+                          MAX_BOARDS_PER_SET)
+        token = util.encode_id_list(list(range(1, MAX_BOARDS_PER_SET + 2)))
+        self.assertRaises(ValueError, util.decode_id_list, token,
+                          MAX_BOARDS_PER_SET)
+
+    def test_malformed(self):
+        for token in ["!!!!", "AB C", "AAAA\n", "AAAA=", "A", "AAAAA",
+                      u"\u05d0",
+                      make_token([0x80]),          # Truncated varint
+                      make_token([2]),             # Run without a length
+                      make_token([2, 0]),          # Empty run
+                      make_token([1, 1]),          # Run starting at 0
+                      make_token([0xff] * 12)]:    # Too long varint
+            self.assertRaises(ValueError, util.decode_id_list, token,
+                              MAX_BOARDS_PER_SET)
+
+if __name__ == "__main__":
+    unittest.main()